@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import mmap
+import shutil
+import sqlite3
+import hashlib
+import zlib
+import re
+import argparse
+import datetime
+import subprocess
+import zstandard
+import stats_sampling
+
+# Archive layout, shared by all campaigns of a workload:
+#   {data_dir}/{workload}/archive/index.sqlite   chunk and file index
+#   {data_dir}/{workload}/archive/segment_NNNNN.zst   zstd frames, one per unique chunk
+# Every chunk is compressed on its own so a file can be read back by
+# decompressing only its chunks out of the memory-mapped segments.
+
+ARCHIVED_TREES = ["stats", "darshan_logs", "interference_results"]
+INDEX_FILE = "index.sqlite"
+SEGMENT_SIZE = 256 * 1024 * 1024
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 256 * 1024
+# Past MIN_CHUNK_SIZE, a line whose crc32 has these bits clear ends a chunk, i.e.
+# about one cut per 64 lines (~20 KiB average chunks on lctl sampler output)
+CHUNK_MASK = (1 << 6) - 1
+ZSTD_LEVEL = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    digest TEXT PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    raw_length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    campaign TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    chunks TEXT NOT NULL,
+    start_time REAL,
+    PRIMARY KEY (campaign, path)
+);
+CREATE INDEX IF NOT EXISTS files_mtime ON files (campaign, mtime);
+"""
+DARSHAN_START_PATTERN = re.compile(r'^#\s*start_time:\s*(\d+)', re.MULTILINE)
+
+
+def split_chunks(data):
+    """
+    Split data into content-defined chunks. Boundaries are placed at line ends
+    chosen by the line's crc32, so an inserted or changed line only changes the
+    chunk it lands in. Binary data without newlines falls back to MAX_CHUNK_SIZE.
+    """
+    chunks = []
+    start = 0
+    pos = 0
+    size = len(data)
+    while pos < size:
+        end = data.find(b"\n", pos, start + MAX_CHUNK_SIZE)
+        if end == -1:
+            end = min(start + MAX_CHUNK_SIZE, size)
+            chunks.append(data[start:end])
+            start = pos = end
+            continue
+        end += 1
+        if end - start >= MIN_CHUNK_SIZE and (zlib.crc32(data[pos:end]) & CHUNK_MASK) == 0:
+            chunks.append(data[start:end])
+            start = end
+        pos = end
+    if start < size:
+        chunks.append(data[start:])
+    return chunks
+
+
+def open_index(archive_dir):
+    os.makedirs(archive_dir, exist_ok=True)
+    db = sqlite3.connect(os.path.join(archive_dir, INDEX_FILE))
+    db.executescript(SCHEMA)
+    if "start_time" not in [row[1] for row in db.execute("PRAGMA table_info(files)")]:
+        # Indexes written before start times were kept: treat files as points
+        db.execute("ALTER TABLE files ADD COLUMN start_time REAL")
+        db.execute("UPDATE files SET start_time = mtime")
+        db.commit()
+    return db
+
+
+def file_start_time(path, local_path, data, darshan_parser):
+    """
+    Time the contents of a file start at, so that a file covering a whole
+    repetition is found by any time window inside it: the first sample of a
+    sampler log, the start_time of an instance meta file or Darshan log.
+    Falls back to the mtime, i.e. the file is treated as a single point.
+    """
+    marker = f"{stats_sampling.SAMPLE_MARKER} ".encode()
+    try:
+        if data.startswith(marker):
+            return float(data[len(marker):data.index(b"\n")].split()[0])
+        if path.endswith("_meta.json"):
+            return float(json.loads(data)['start_time'])
+        if path.endswith(".darshan"):
+            result = subprocess.run([darshan_parser, local_path], stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL, text=True, check=False)
+            m = DARSHAN_START_PATTERN.search(result.stdout)
+            if m:
+                return float(m.group(1))
+    except (ValueError, KeyError, IndexError, TypeError, OSError):
+        pass
+    return os.path.getmtime(local_path)
+
+
+def segment_path(archive_dir, segment):
+    return os.path.join(archive_dir, f"segment_{segment:05d}.zst")
+
+
+def campaign_files(data_dir, workload, timestamp):
+    """
+    Yield (archive path, local path) for every file of a campaign.
+    """
+    for tree in ARCHIVED_TREES:
+        root = os.path.join(data_dir, workload, tree, timestamp)
+        if not os.path.isdir(root):
+            continue
+        for dirpath, dirs, files in os.walk(root):
+            dirs.sort()
+            for file in sorted(files):
+                local_path = os.path.join(dirpath, file)
+                yield os.path.join(tree, os.path.relpath(local_path, root)), local_path
+
+
+def pack_campaign(data_dir, workload, timestamp, archive_dir, darshan_parser="darshan-parser"):
+    """
+    Add all stats, Darshan logs and interference results of one campaign to the archive.
+    """
+    db = open_index(archive_dir)
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    row = db.execute("SELECT MAX(segment) FROM chunks").fetchone()
+    segment = row[0] if row[0] is not None else 0
+    segment_file = open(segment_path(archive_dir, segment), "ab")
+    stats = {'files': 0, 'bytes': 0, 'chunks': 0, 'new_chunks': 0, 'stored_bytes': 0}
+    try:
+        for path, local_path in campaign_files(data_dir, workload, timestamp):
+            with open(local_path, "rb") as f:
+                data = f.read()
+            digests = []
+            for chunk in split_chunks(data):
+                digest = hashlib.sha256(chunk).hexdigest()
+                digests.append(digest)
+                stats['chunks'] += 1
+                if db.execute("SELECT 1 FROM chunks WHERE digest = ?", (digest,)).fetchone():
+                    continue
+                frame = compressor.compress(chunk)
+                if segment_file.tell() + len(frame) > SEGMENT_SIZE and segment_file.tell() > 0:
+                    segment_file.flush()
+                    os.fsync(segment_file.fileno())
+                    segment_file.close()
+                    segment += 1
+                    segment_file = open(segment_path(archive_dir, segment), "ab")
+                offset = segment_file.tell()
+                segment_file.write(frame)
+                db.execute("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", (digest, segment, offset, len(frame), len(chunk)))
+                stats['new_chunks'] += 1
+                stats['stored_bytes'] += len(frame)
+            mtime = os.path.getmtime(local_path)
+            start_time = min(file_start_time(path, local_path, data, darshan_parser), mtime)
+            db.execute("INSERT OR REPLACE INTO files (campaign, path, mtime, size, digest, chunks, start_time) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (timestamp, path, mtime, len(data), hashlib.sha256(data).hexdigest(), json.dumps(digests), start_time))
+            stats['files'] += 1
+            stats['bytes'] += len(data)
+        # Segments must be on disk before the index refers to them; full ones
+        # were synced when they were rolled over
+        segment_file.flush()
+        os.fsync(segment_file.fileno())
+        db.commit()
+    finally:
+        segment_file.close()
+        db.close()
+    print(f"Archived campaign {timestamp}: {stats['files']} files, {stats['bytes']} bytes, "
+          f"{stats['new_chunks']}/{stats['chunks']} new chunks, {stats['stored_bytes']} bytes stored")
+    return stats
+
+
+class CampaignArchive:
+    """
+    Read-only access to archived files through memory-mapped segments.
+    """
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self.db = sqlite3.connect(f"file:{os.path.join(archive_dir, INDEX_FILE)}?mode=ro", uri=True)
+        self.decompressor = zstandard.ZstdDecompressor()
+        self.segments = {}
+
+    def close(self):
+        for f, mapped in self.segments.values():
+            mapped.close()
+            f.close()
+        self.segments.clear()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _segment(self, segment):
+        if segment not in self.segments:
+            f = open(segment_path(self.archive_dir, segment), "rb")
+            self.segments[segment] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return self.segments[segment][1]
+
+    def campaigns(self):
+        return [row[0] for row in self.db.execute("SELECT DISTINCT campaign FROM files ORDER BY campaign")]
+
+    def list_files(self, campaign, prefix="", start=None, end=None):
+        """
+        Return (path, start_time, mtime, size) of the files of a campaign,
+        optionally limited to a path prefix and to the files whose contents
+        [start_time, mtime] overlap the window [start, end].
+        """
+        query = "SELECT path, start_time, mtime, size FROM files WHERE campaign = ? AND substr(path, 1, ?) = ?"
+        params = [campaign, len(prefix), prefix]
+        if start is not None:
+            query += " AND mtime >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND start_time <= ?"
+            params.append(end)
+        return self.db.execute(query + " ORDER BY start_time, path", params).fetchall()
+
+    def read_file(self, campaign, path):
+        row = self.db.execute("SELECT chunks, digest FROM files WHERE campaign = ? AND path = ?", (campaign, path)).fetchone()
+        if row is None:
+            raise KeyError(f"{path} is not archived for campaign {campaign}")
+        parts = []
+        for digest in json.loads(row[0]):
+            segment, offset, length, raw_length = self.db.execute(
+                "SELECT segment, offset, length, raw_length FROM chunks WHERE digest = ?", (digest,)).fetchone()
+            frame = self._segment(segment)[offset:offset + length]
+            parts.append(self.decompressor.decompress(frame, max_output_size=raw_length))
+        return b"".join(parts)
+
+    def read_window(self, campaign, start, end, prefix=""):
+        """
+        Yield (path, data) for every file of a campaign whose contents overlap [start, end].
+        """
+        for path, start_time, mtime, size in self.list_files(campaign, prefix, start, end):
+            yield path, self.read_file(campaign, path)
+
+    def verify(self, campaign):
+        for path, start_time, mtime, size in self.list_files(campaign):
+            digest = self.db.execute("SELECT digest FROM files WHERE campaign = ? AND path = ?", (campaign, path)).fetchone()[0]
+            if hashlib.sha256(self.read_file(campaign, path)).hexdigest() != digest:
+                print(f"Archive verification failed for {path}")
+                return False
+        return True
+
+
+def parse_time(value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def main(args):
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    archive_dir = os.path.join(config['data_dir'], args.workload, "archive")
+
+    if args.command == "pack":
+        pack_campaign(config['data_dir'], args.workload, args.timestamp, archive_dir,
+                      config.get('darshan_parser', "darshan-parser"))
+        if args.remove:
+            with CampaignArchive(archive_dir) as archive:
+                if not archive.verify(args.timestamp):
+                    sys.exit(1)
+            for tree in ARCHIVED_TREES:
+                campaign_dir = os.path.join(config['data_dir'], args.workload, tree, args.timestamp)
+                if os.path.isdir(campaign_dir):
+                    print(f"Removing {campaign_dir}")
+                    shutil.rmtree(campaign_dir)
+    elif args.command == "list":
+        with CampaignArchive(archive_dir) as archive:
+            campaigns = [args.timestamp] if args.timestamp else archive.campaigns()
+            for campaign in campaigns:
+                for path, start_time, mtime, size in archive.list_files(campaign, args.prefix, parse_time(args.start), parse_time(args.end)):
+                    print(f"{campaign}\t{datetime.datetime.fromtimestamp(start_time).isoformat()}\t"
+                          f"{datetime.datetime.fromtimestamp(mtime).isoformat()}\t{size}\t{path}")
+    elif args.command == "extract":
+        with CampaignArchive(archive_dir) as archive:
+            for path, data in archive.read_window(args.timestamp, parse_time(args.start), parse_time(args.end), args.prefix):
+                out_path = os.path.join(args.out, args.timestamp, path)
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+                with open(out_path, "wb") as f:
+                    f.write(data)
+                print(f"Extracted {path} -> {out_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Archive finished campaigns into deduplicated, compressed segments.')
+    parser.add_argument('command', choices=["pack", "list", "extract"], help='Archive operation')
+    parser.add_argument('--timestamp', type=str, help='Campaign IOSENSE_LOG_TIMESTAMP')
+    parser.add_argument('--workload', type=str, default="IO500", help='Target workload of the campaign')
+    parser.add_argument('--config', type=str, default="cluster_config.json", help='Path to the config file')
+    parser.add_argument('--remove', action='store_true', help='Remove the campaign directories after packing and verifying')
+    parser.add_argument('--prefix', type=str, default="", help='Only files under this archive path, e.g. stats/server0')
+    parser.add_argument('--start', type=str, help='Window start (epoch seconds or ISO time)')
+    parser.add_argument('--end', type=str, help='Window end (epoch seconds or ISO time)')
+    parser.add_argument('--out', type=str, default=".", help='Extraction directory')
+    args = parser.parse_args()
+    if args.command in ("pack", "extract") and not args.timestamp:
+        parser.error(f"--timestamp is required for {args.command}")
+
+    main(args)
@@ -0,0 +1,157 @@
+import os
+import re
+import json
+import itertools
+
+# Example "target_variants" section of the cluster config:
+#
+#   "target_variants": {
+#       "parallelism": 2,
+#       "target_nodes": ["node0"],
+#       "cores_per_slot": 8,
+#       "apps": {
+#           "amrex": {"ranks": [2, 4, 8], "parameters": {"ncells": ["64", "128"]}},
+#           "IO500": {"ranks": [4, 8], "parameters": {"ior-easy.blocksize": ["1g", "4g"]}}
+#       }
+#   }
+#
+# For the h5bench apps a parameter name is a key of benchmarks[*].configuration
+# and replaces it in every benchmark that already sets it, or "<index>.<key>"
+# to set it in benchmarks[index] only (e.g. "0.grid" for the openpmd write);
+# for IO500 it is "<section>.<key>" of the ini file.
+
+NP_PATTERN = re.compile(r'-np\s+\d+')
+UNSAFE_NAME_PATTERN = re.compile(r'[^A-Za-z0-9-]')
+INI_SECTION_PATTERN = re.compile(r'^\s*\[([^\]]+)\]\s*$')
+INI_OPTION_PATTERN = re.compile(r'^(\s*)([^#;=\s][^=]*?)(\s*=\s*)(.*)$')
+
+
+def get_variant_spec(config, app_name):
+    """
+    Return the variant spec for app_name from the cluster config, or None.
+    """
+    return config.get('target_variants', {}).get('apps', {}).get(app_name)
+
+
+def variant_combinations(spec):
+    """
+    Yield (ranks, overrides) for the cartesian product of the spec.
+    A missing "ranks" entry keeps the rank count of the base config.
+    """
+    ranks = spec.get('ranks') or [None]
+    parameters = spec.get('parameters', {})
+    names = sorted(parameters)
+    empty = [name for name in names if not parameters[name]]
+    if empty:
+        # The product would be empty and the base config would never run
+        raise ValueError(f"Variant parameters without values: {empty}")
+    for rank in ranks:
+        for values in itertools.product(*[parameters[name] for name in names]):
+            yield rank, dict(zip(names, values))
+
+
+def variant_name(base_name, ranks, overrides):
+    parts = [base_name]
+    if ranks is not None:
+        parts.append(f"np{ranks}")
+    for name, value in overrides.items():
+        parts.append(UNSAFE_NAME_PATTERN.sub("-", f"{name}{value}"))
+    return "_".join(str(part) for part in parts)
+
+
+def write_json_variant(base_config_file, variant_file, data_dir, ranks, overrides):
+    with open(base_config_file, "r") as f:
+        variant = json.load(f)
+    if ranks is not None:
+        mpi = variant.setdefault('mpi', {})
+        mpi['ranks'] = str(ranks)
+        mpi['configuration'] = NP_PATTERN.sub(f"-np {ranks}", mpi.get('configuration', f"-np {ranks}"))
+    variant['directory'] = data_dir
+    benchmarks = variant.get('benchmarks', [])
+    for name, value in overrides.items():
+        index, _, key = name.partition(".")
+        if key and index.isdigit():
+            if int(index) >= len(benchmarks):
+                raise ValueError(f"{base_config_file} has no benchmark {index} for variant parameter {name}")
+            benchmarks[int(index)].setdefault('configuration', {})[key] = str(value)
+            continue
+        # Only benchmarks that use the parameter, e.g. not the openpmd read for a write-side grid
+        targets = [benchmark['configuration'] for benchmark in benchmarks if name in benchmark.get('configuration', {})]
+        if not targets:
+            raise ValueError(f"No benchmark in {base_config_file} sets variant parameter {name}")
+        for configuration in targets:
+            configuration[name] = str(value)
+    with open(variant_file, "w") as f:
+        json.dump(variant, f, indent=4)
+
+
+def write_ini_variant(base_config_file, variant_file, data_dir, overrides):
+    """
+    Copy the base ini line by line and only replace the overridden options, so
+    comments, option case and values (io500 parses them, not configparser) are
+    kept as they are. Options missing from the base are appended to their section.
+    """
+    pending = {'global': {'datadir': ("datadir", os.path.join(data_dir, "datafiles")),
+                          'resultdir': ("resultdir", os.path.join(data_dir, "results"))}}
+    for name, value in overrides.items():
+        section, key = name.split(".", 1)
+        pending.setdefault(section, {})[key.lower()] = (key, str(value))
+
+    with open(base_config_file, "r") as f:
+        lines = f.read().splitlines()
+    out = []
+
+    def add_missing(section):
+        for key, value in pending.pop(section, {}).values():
+            out.append(f"{key} = {value}")
+
+    section = None
+    for line in lines:
+        m = INI_SECTION_PATTERN.match(line)
+        if m:
+            add_missing(section)
+            section = m.group(1).strip()
+            out.append(line)
+            continue
+        m = INI_OPTION_PATTERN.match(line)
+        if m and m.group(2).strip().lower() in pending.get(section, {}):
+            key, value = pending[section].pop(m.group(2).strip().lower())
+            out.append(f"{m.group(1)}{m.group(2)}{m.group(3)}{value}")
+            continue
+        out.append(line)
+    add_missing(section)
+    for section in list(pending):
+        out.extend(["", f"[{section}]"])
+        add_missing(section)
+
+    with open(variant_file, "w") as f:
+        f.write("\n".join(out) + "\n")
+
+
+def expand_config_variants(base_config_file, spec, variants_dir, data_root, darshan_root):
+    """
+    Generate one config file per (ranks, parameters) combination of spec.
+    Each variant gets its own data directory under data_root and its own
+    Darshan log directory under darshan_root.
+    """
+    os.makedirs(variants_dir, exist_ok=True)
+    base_name, ext = os.path.splitext(os.path.basename(base_config_file))
+    variants = []
+    for ranks, overrides in variant_combinations(spec):
+        name = variant_name(base_name, ranks, overrides)
+        variant_file = os.path.join(variants_dir, f"{name}{ext}")
+        data_dir = os.path.join(data_root, name)
+        if ext == ".ini":
+            write_ini_variant(base_config_file, variant_file, data_dir, overrides)
+        else:
+            write_json_variant(base_config_file, variant_file, data_dir, ranks, overrides)
+        variants.append({
+            'name': name,
+            'config_file': variant_file,
+            'data_dir': data_dir,
+            'darshan_dir': os.path.join(darshan_root, name),
+            'ranks': ranks,
+            'overrides': overrides,
+        })
+        print(f"Created variant {name}: {variant_file}")
+    return variants
@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+import configparser
+import numpy as np
+import pyarrow as pa
+import stats_sampling
+
+# One row per (target config, interference level, repetition, time window):
+#   key columns       interference_level, repetition, run_index, config_id,
+#                     window_index, window_start, window_length
+#   config.<param>    numeric config parameters; string values are one-hot
+#                     encoded as config.<param>=<value>, except paths and commands
+#   server.<counter>  per-second rate of each server counter over the window,
+#                     summed over targets and hosts
+#   darshan.<field>   per-run Darshan totals and throughput of the target run;
+#                     per-module performance is darshan.<MODULE>.<field>
+# The matrix is saved with np.save so it can be opened with mmap_mode='r';
+# column names and config names go to a .columns.json file next to it.
+
+KEY_COLUMNS = ["interference_level", "repetition", "run_index", "config_id", "window_index", "window_start", "window_length"]
+DARSHAN_PATTERN = re.compile(r'^darshan_logs/[^/]+/interference_level_(\d+)/(\d+)/(.+)_(\d+)\.darshan$')
+DARSHAN_FIELD_PATTERN = re.compile(r'^#?\s*(\w+):\s*(-?[\d.]+(?:[eE][+-]?\d+)?)\b')
+DARSHAN_TOTAL_SUFFIXES = ("_BYTES_READ", "_BYTES_WRITTEN", "_READS", "_WRITES", "_OPENS",
+                          "_F_READ_TIME", "_F_WRITE_TIME", "_F_META_TIME")
+DARSHAN_HEADER_FIELDS = ("start_time", "end_time", "nprocs")
+# --perf prints these once per module, so they are kept as darshan.<MODULE>.<field>
+DARSHAN_MODULE_FIELDS = ("agg_perf_by_slowest", "agg_time_by_slowest")
+DARSHAN_MODULE_PATTERN = re.compile(r'^#\s*(\S+) module data\s*$')
+# Fixed darshan-parser --total --perf output for check_darshan_parsing: module
+# names are not plain words (MPI-IO) and the perf fields repeat per module
+DARSHAN_SAMPLE_OUTPUT = """# darshan log version: 3.41
+# exe: ./io500 config.ini
+# nprocs: 4
+# start_time: 1700000000
+# end_time: 1700000060
+# *******************************************************
+# POSIX module data
+# *******************************************************
+total_POSIX_BYTES_WRITTEN: 1048576000
+# performance
+# -----------
+# agg_time_by_slowest: 9.950000
+# agg_perf_by_slowest: 100.500000
+# *******************************************************
+# MPI-IO module data
+# *******************************************************
+total_MPIIO_BYTES_WRITTEN: 1048576000
+# performance
+# -----------
+# agg_time_by_slowest: 11.100000
+# agg_perf_by_slowest: 90.100000
+"""
+DARSHAN_SAMPLE_FEATURES = {
+    "darshan.nprocs": 4.0,
+    "darshan.start_time": 1700000000.0,
+    "darshan.end_time": 1700000060.0,
+    "darshan.total_POSIX_BYTES_WRITTEN": 1048576000.0,
+    "darshan.total_MPIIO_BYTES_WRITTEN": 1048576000.0,
+    "darshan.POSIX.agg_time_by_slowest": 9.95,
+    "darshan.POSIX.agg_perf_by_slowest": 100.5,
+    "darshan.MPI-IO.agg_time_by_slowest": 11.1,
+    "darshan.MPI-IO.agg_perf_by_slowest": 90.1,
+}
+SIZE_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)\s*([kmgtp])i?b?$', re.IGNORECASE)
+SIZE_UNITS = {"k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40, "p": 1 << 50}
+PARAM_PATTERN = re.compile(r'^([\w-]+)\.([^.=]+)\.([\w.-]+)=(.*)$')
+NUMBER_PATTERN = re.compile(r'^-?\d+(?:\.\d+)?$')
+# Non-numeric options that hold paths or commands: they say where a run put
+# its data, not how it did I/O, and one-hot encoded they would only identify
+# runs (every variant has its own datadir/resultdir)
+CONFIG_PATH_KEYS = ("datadir", "resultdir", "pause-dir", "netcdf", "file")
+CONFIG_COMMAND_SUFFIX = "-cmd"
+
+
+def parse_value(value):
+    """
+    Convert a config value to a float, or return None if it is not numeric.
+    """
+    value = str(value).strip()
+    if value.lower() in ("true", "false"):
+        return 1.0 if value.lower() == "true" else 0.0
+    if NUMBER_PATTERN.match(value):
+        return float(value)
+    m = SIZE_PATTERN.match(value)
+    if m:
+        return float(m.group(1)) * SIZE_UNITS[m.group(2).lower()]
+    return None
+
+
+def is_path_or_command(name, value):
+    key = name.rsplit(".", 1)[-1].lower()
+    return key in CONFIG_PATH_KEYS or key.endswith(CONFIG_COMMAND_SUFFIX) or "/" in str(value)
+
+
+def config_features(config_file):
+    """
+    Flatten an IO500 ini or h5bench JSON config into numeric features.
+    """
+    params = {}
+    if config_file.endswith(".ini"):
+        ini = configparser.ConfigParser(interpolation=None)
+        ini.read(config_file)
+        for section in ini.sections():
+            for key, value in ini[section].items():
+                params[f"{section}.{key}"] = value
+    else:
+        with open(config_file, "r") as f:
+            config = json.load(f)
+        params["mpi.ranks"] = config.get('mpi', {}).get('ranks', "")
+        for benchmark in config.get('benchmarks', []):
+            for key, value in benchmark.get('configuration', {}).items():
+                params[f"{benchmark.get('benchmark', 'benchmark')}.{key}"] = value
+    features = {}
+    for name, value in params.items():
+        if value is None or str(value).strip() == "":
+            continue
+        number = parse_value(value)
+        if number is not None:
+            features[f"config.{name}"] = number
+        elif not is_path_or_command(name, value):
+            features[f"config.{name}={str(value).strip()}"] = 1.0
+    return features
+
+
+def find_config_file(config, workload, timestamp, interference_level, repetition_idx, config_name):
+    client_root = config['client']['install_dir']
+    candidates = [
+        os.path.join(client_root, "variant_configs", timestamp, f"interference_level_{interference_level}", str(repetition_idx)),
+        os.path.join(client_root, f"workloads/{workload}/regular_configs"),
+    ]
+    for config_dir in candidates:
+        for ext in (".ini", ".json"):
+            path = os.path.join(config_dir, config_name + ext)
+            if os.path.exists(path):
+                return path
+    return None
+
+
+def darshan_features(darshan_parser, log_path):
+    """
+    Run darshan-parser on a log and return its run window and totals.
+    """
+    result = subprocess.run([darshan_parser, "--total", "--perf", log_path],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=False)
+    if result.returncode != 0:
+        print(f"Error parsing Darshan log {log_path}: {result.stderr}")
+        return None
+    features = parse_darshan_output(result.stdout)
+    if "darshan.start_time" not in features or "darshan.end_time" not in features:
+        print(f"Darshan log {log_path} has no run time window, skipping")
+        return None
+    run_time = max(features["darshan.end_time"] - features["darshan.start_time"], 1.0)
+    moved = sum(value for name, value in features.items() if name.endswith(("_BYTES_READ", "_BYTES_WRITTEN")) and "POSIX" in name)
+    features["darshan.throughput_mib_s"] = moved / run_time / (1 << 20)
+    return features
+
+
+def parse_darshan_output(output):
+    """
+    Pick the header fields, module totals and per-module performance out of
+    darshan-parser --total --perf output.
+    """
+    features = {}
+    module = None
+    for line in output.splitlines():
+        m = DARSHAN_MODULE_PATTERN.match(line.strip())
+        if m:
+            module = m.group(1)
+            continue
+        m = DARSHAN_FIELD_PATTERN.match(line.strip())
+        if not m:
+            continue
+        name, value = m.group(1), float(m.group(2))
+        if name in DARSHAN_HEADER_FIELDS or (name.startswith("total_") and name.endswith(DARSHAN_TOTAL_SUFFIXES)):
+            features[f"darshan.{name}"] = value
+        elif name in DARSHAN_MODULE_FIELDS and module:
+            features[f"darshan.{module}.{name}"] = value
+    return features
+
+
+def check_darshan_parsing():
+    """
+    Parse DARSHAN_SAMPLE_OUTPUT and compare against DARSHAN_SAMPLE_FEATURES.
+    Returns the list of mismatches, empty when parsing works.
+    """
+    features = parse_darshan_output(DARSHAN_SAMPLE_OUTPUT)
+    errors = []
+    for name in sorted(set(features) | set(DARSHAN_SAMPLE_FEATURES)):
+        if features.get(name) != DARSHAN_SAMPLE_FEATURES.get(name):
+            errors.append(f"{name}: parsed {features.get(name)}, expected {DARSHAN_SAMPLE_FEATURES.get(name)}")
+    return errors
+
+
+def collect_runs(config, workload, timestamp, darshan_parser):
+    """
+    One entry per target run, found through the gathered Darshan logs.
+    """
+    root = os.path.join(config['data_dir'], workload)
+    runs = []
+    darshan_root = os.path.join(root, "darshan_logs", timestamp)
+    for dirpath, dirs, files in os.walk(darshan_root):
+        dirs.sort()
+        for file in sorted(files):
+            path = os.path.join(dirpath, file)
+            m = DARSHAN_PATTERN.match(os.path.relpath(path, root).replace(os.sep, "/"))
+            if not m:
+                continue
+            interference_level, repetition_idx, config_name, run_index = m.groups()
+            features = darshan_features(darshan_parser, path)
+            if features is None:
+                continue
+            config_file = find_config_file(config, workload, timestamp, interference_level, repetition_idx, config_name)
+            if config_file:
+                features.update(config_features(config_file))
+            else:
+                print(f"No config file found for {config_name}, config columns will be empty")
+            runs.append({'config': config_name, 'interference_level': int(interference_level),
+                         'repetition': int(repetition_idx), 'run_index': int(run_index), 'features': features})
+    return runs
+
+
+def parse_sample(group, lines):
+    """
+    Sum the counters of one sampler block over all targets.
+    """
+    counters = {}
+    prefix = group
+
+    def add(name, value):
+        counters[name] = counters.get(name, 0.0) + value
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        m = PARAM_PATTERN.match(line)
+        if m:
+            # <type>.<target>.<param>=<value>; the target is dropped so targets add up
+            obd_type, target, param, value = m.groups()
+            prefix = f"{group}.{obd_type}.{param}"
+            if NUMBER_PATTERN.match(value.strip()):
+                add(prefix, float(value))
+            continue
+        fields = line.split()
+        if fields[0].rstrip(":") in stats_sampling.VOLATILE_FIELDS:
+            continue
+        if len(fields) >= 3 and fields[2] == "samples" and fields[1].isdigit():
+            # <stat> <count> samples [<unit>] <min> <max> <sum> ...
+            add(f"{prefix}.{fields[0]}", float(fields[1]))
+            if len(fields) >= 7 and fields[3] == "[bytes]" and fields[6].isdigit():
+                add(f"{prefix}.{fields[0]}.sum", float(fields[6]))
+        elif len(fields) == 2 and fields[0].endswith(":") and NUMBER_PATTERN.match(fields[1]):
+            # lnetctl stats show is YAML
+            add(f"{group}.{fields[0].rstrip(':')}", float(fields[1]))
+    return counters
+
+
+def load_host_series(stats_root):
+    """
+    Read every <group>.log of every host under a campaign's stats tree.
+    Returns {host: (times, names, values)} with values forward-filled.
+    """
+    samples = {}
+    for entry in sorted(os.listdir(stats_root)):
+        host_dir = os.path.join(stats_root, entry)
+        if not os.path.isdir(host_dir):
+            continue
+        # gather_stats names the directories <host>_<YYYYmmdd>_<HHMMSS>
+        host = entry.rsplit("_", 2)[0]
+        for file in sorted(os.listdir(host_dir)):
+            if not file.endswith(".log"):
+                continue
+            group = file[:-len(".log")]
+            timestamp, block = None, []
+            with open(os.path.join(host_dir, file), "r", errors="replace") as f:
+                for line in list(f) + [f"{stats_sampling.SAMPLE_MARKER} end"]:
+                    if line.startswith(stats_sampling.SAMPLE_MARKER + " "):
+                        if timestamp is not None:
+                            samples.setdefault(host, []).append((timestamp, parse_sample(group, block)))
+                        fields = line.split()
+                        timestamp = float(fields[1]) if len(fields) > 1 and NUMBER_PATTERN.match(fields[1]) else None
+                        block = []
+                    else:
+                        block.append(line)
+    series = {}
+    for host, host_samples in samples.items():
+        host_samples.sort(key=lambda sample: sample[0])
+        names = sorted({name for _, counters in host_samples for name in counters})
+        index = {name: i for i, name in enumerate(names)}
+        times = np.array([t for t, _ in host_samples], dtype=np.float64)
+        values = np.full((len(host_samples), len(names)), np.nan)
+        for row, (_, counters) in enumerate(host_samples):
+            for name, value in counters.items():
+                values[row, index[name]] = value
+        # Samples of one group do not carry the other groups' counters
+        filled = np.where(np.isnan(values), 0, np.arange(len(times))[:, None])
+        np.maximum.accumulate(filled, axis=0, out=filled)
+        values = values[filled, np.arange(len(names))[None, :]]
+        series[host] = (times, names, values)
+    if not series:
+        print(f"No sampler logs found under {stats_root}")
+    return series
+
+
+def window_counter_rates(series, window_start, window_end):
+    """
+    Per-second rate of every counter over each window, summed over hosts.
+    Counters are cumulative and samplers only log changes, so the value at a
+    time is the last sample at or before it.
+    """
+    names = sorted({name for _, host_names, _ in series.values() for name in host_names})
+    column = {name: i for i, name in enumerate(names)}
+    rates = np.full((len(window_start), len(names)), np.nan)
+    length = np.maximum(window_end - window_start, 1e-9)[:, None]
+    for times, host_names, values in series.values():
+        if len(times) == 0:
+            continue
+        start_idx = np.searchsorted(times, window_start, side="right") - 1
+        end_idx = np.searchsorted(times, window_end, side="right") - 1
+        start_vals = np.where((start_idx >= 0)[:, None], values[np.maximum(start_idx, 0)], np.nan)
+        end_vals = np.where((end_idx >= 0)[:, None], values[np.maximum(end_idx, 0)], np.nan)
+        host_rates = (end_vals - start_vals) / length
+        cols = [column[name] for name in host_names]
+        current = rates[:, cols]
+        rates[:, cols] = np.where(np.isnan(current), host_rates, np.where(np.isnan(host_rates), current, current + host_rates))
+    return [f"server.{name}" for name in names], rates
+
+
+def build_dataset(config, workload, timestamp, window, darshan_parser):
+    runs = collect_runs(config, workload, timestamp, darshan_parser)
+    if not runs:
+        print(f"No target runs found for campaign {timestamp}")
+        return None, None, None
+    configs = sorted({run['config'] for run in runs})
+    config_ids = {name: i for i, name in enumerate(configs)}
+
+    # Windows of all runs at once
+    starts = np.array([run['features']['darshan.start_time'] for run in runs])
+    ends = np.array([run['features']['darshan.end_time'] for run in runs])
+    counts = np.maximum(np.ceil((ends - starts) / window).astype(np.int64), 1)
+    run_idx = np.repeat(np.arange(len(runs)), counts)
+    window_index = np.arange(run_idx.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    window_start = starts[run_idx] + window_index * window
+    window_end = np.minimum(window_start + window, ends[run_idx])
+
+    keys = np.array([[run['interference_level'], run['repetition'], run['run_index'], config_ids[run['config']]] for run in runs], dtype=np.float64)
+    key_matrix = np.column_stack([keys[run_idx], window_index, window_start, window_end - window_start])
+
+    feature_names = sorted({name for run in runs for name in run['features']})
+    run_features = np.array([[run['features'].get(name, np.nan) for name in feature_names] for run in runs], dtype=np.float64)
+
+    stats_root = os.path.join(config['data_dir'], workload, "stats", timestamp)
+    series = load_host_series(stats_root) if os.path.isdir(stats_root) else {}
+    counter_names, counter_rates = window_counter_rates(series, window_start, window_end)
+
+    columns = KEY_COLUMNS + feature_names + counter_names
+    matrix = np.hstack([key_matrix, run_features[run_idx], counter_rates])
+    return matrix, columns, configs
+
+
+def save_dataset(out_path, matrix, columns, configs, metadata, fmt):
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(f"{out_path}.columns.json", "w") as f:
+        json.dump(dict(metadata, columns=columns, configs=configs), f, indent=4)
+    if fmt == "arrow":
+        table = pa.table({name: matrix[:, i] for i, name in enumerate(columns)})
+        with pa.OSFile(f"{out_path}.arrow", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        print(f"Wrote {matrix.shape[0]} rows x {matrix.shape[1]} columns to {out_path}.arrow")
+    else:
+        np.save(f"{out_path}.npy", matrix)
+        print(f"Wrote {matrix.shape[0]} rows x {matrix.shape[1]} columns to {out_path}.npy")
+
+
+def load_arrow_matrix(path):
+    """
+    Read an exported .arrow file back into a (rows, columns) float64 matrix.
+    The record batches are memory-mapped; only the column stacking copies.
+    """
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return np.column_stack([table.column(i).to_numpy() for i in range(table.num_columns)]), table.column_names
+
+
+def load_dataset(paths):
+    """
+    Load exported .npy or .arrow datasets. A single .npy dataset is returned
+    memory-mapped; several are aligned on the union of their columns (missing
+    ones are NaN).
+    """
+    datasets = []
+    for path in paths:
+        base, ext = os.path.splitext(path)
+        if ext not in (".npy", ".arrow"):
+            base, ext = path, ".arrow" if os.path.exists(f"{path}.arrow") else ".npy"
+        with open(f"{base}.columns.json", "r") as f:
+            columns = json.load(f)['columns']
+        if ext == ".arrow":
+            matrix, arrow_columns = load_arrow_matrix(f"{base}.arrow")
+            if arrow_columns != columns:
+                raise ValueError(f"Columns of {base}.arrow do not match {base}.columns.json")
+            datasets.append((matrix, columns))
+        else:
+            datasets.append((np.load(f"{base}.npy", mmap_mode="r"), columns))
+    if len(datasets) == 1:
+        return datasets[0]
+    columns = list(datasets[0][1])
+    for _, dataset_columns in datasets[1:]:
+        columns += [name for name in dataset_columns if name not in set(columns)]
+    index = {name: i for i, name in enumerate(columns)}
+    matrix = np.full((sum(m.shape[0] for m, _ in datasets), len(columns)), np.nan)
+    row = 0
+    for m, dataset_columns in datasets:
+        matrix[row:row + m.shape[0], [index[name] for name in dataset_columns]] = m
+        row += m.shape[0]
+    return matrix, columns
+
+
+def main(args):
+    # A parsing regression would silently mislabel Darshan columns
+    errors = check_darshan_parsing()
+    if errors:
+        print("Darshan output parsing check failed:\n   " + "\n   ".join(errors))
+        sys.exit(1)
+    if args.check:
+        print("Darshan output parsing check passed")
+        return
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    out_dir = args.out or os.path.join(config['data_dir'], args.workload, "datasets")
+    darshan_parser = config.get('darshan_parser', "darshan-parser")
+    for timestamp in args.timestamp:
+        print(f"Exporting campaign {timestamp}...")
+        matrix, columns, configs = build_dataset(config, args.workload, timestamp, args.window, darshan_parser)
+        if matrix is None:
+            sys.exit(1)
+        metadata = {'campaign': timestamp, 'workload': args.workload, 'window': args.window}
+        save_dataset(os.path.join(out_dir, f"{args.workload}_{timestamp}"), matrix, columns, configs, metadata, args.format)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export finished campaigns as a feature matrix for modelling.')
+    parser.add_argument('--timestamp', type=str, nargs='+', help='Campaign IOSENSE_LOG_TIMESTAMP(s)')
+    parser.add_argument('--workload', type=str, default="IO500", help='Target workload of the campaign')
+    parser.add_argument('--window', type=float, default=10.0, help='Time window length in seconds')
+    parser.add_argument('--format', type=str, choices=["npy", "arrow"], default="npy", help='Output format')
+    parser.add_argument('--config', type=str, default="cluster_config.json", help='Path to the config file')
+    parser.add_argument('--out', type=str, help='Output directory (default: <data_dir>/<workload>/datasets)')
+    parser.add_argument('--check', action='store_true', help='Only check Darshan output parsing against a fixed sample')
+    args = parser.parse_args()
+    if not args.check and not args.timestamp:
+        parser.error("--timestamp is required unless --check is given")
+
+    main(args)
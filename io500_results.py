@@ -0,0 +1,138 @@
+import os
+import re
+import csv
+import json
+import tarfile
+
+# Lines printed by io500 (and written to result_summary.txt) look like:
+#   [RESULT]       ior-easy-write        7.893215 GiB/s : time 312.118 seconds
+#   [RESULT]    mdtest-easy-write       42.156283 kIOPS : time 304.882 seconds [INVALID]
+RESULT_PATTERN = re.compile(r'^\[\s*(RESULT[^\]]*)\]\s+(\S+)\s+([\d.]+)\s+(\S+)\s*:\s*time\s+([\d.]+)\s+seconds(.*)$')
+TARBALL_PATTERN = re.compile(r'^Created result tarball (\S+)')
+
+PHASE_TABLE_FILE = "io500_phase_table.csv"
+PHASE_SUMMARY_FILE = "io500_phase_summary.json"
+PHASE_TABLE_FIELDS = ["host", "slot", "instance", "config", "phase", "bandwidth_gib_s", "kiops", "duration_s", "valid"]
+
+
+def interference_results_dir(root, timestamp, interference_level, repetition_idx):
+    """
+    Directory holding the per-slot IO500 outputs of one interference run.
+    """
+    return os.path.join(root, timestamp, f"interference_level_{interference_level}", str(repetition_idx))
+
+
+def parse_io500_output(path):
+    """
+    Parse the [RESULT] lines of an io500 stdout capture or result_summary.txt.
+    Phases of an instance that was terminated early are simply missing.
+    """
+    phases = []
+    try:
+        with open(path, "r", errors="replace") as f:
+            for line in f:
+                m = RESULT_PATTERN.match(line.strip())
+                if not m:
+                    continue
+                tag, phase, value, unit, duration, rest = m.groups()
+                value = float(value)
+                phases.append({
+                    "phase": phase,
+                    "bandwidth_gib_s": value if unit == "GiB/s" else None,
+                    "kiops": value if unit == "kIOPS" else None,
+                    "duration_s": float(duration),
+                    "valid": "invalid" not in (tag + rest).lower(),
+                })
+    except Exception as e:
+        print(f"Error parsing IO500 output {path}: {e}")
+    return phases
+
+
+def find_result_tarball(output_path):
+    """
+    Return the result tarball path announced in an io500.sh stdout capture, if any.
+    """
+    try:
+        with open(output_path, "r", errors="replace") as f:
+            for line in f:
+                m = TARBALL_PATTERN.match(line.strip())
+                if m:
+                    return m.group(1)
+    except Exception as e:
+        print(f"Error reading IO500 output {output_path}: {e}")
+    return None
+
+
+def save_result_summary(output_path, summary_path):
+    """
+    Copy result_summary.txt out of the result tarball of a finished instance,
+    since the result directories are removed by the target workload cleanup.
+    """
+    tarball = find_result_tarball(output_path)
+    if not tarball or not os.path.exists(tarball):
+        return False
+    try:
+        with tarfile.open(tarball, "r:gz") as tar:
+            for member in tar.getmembers():
+                if os.path.basename(member.name) == "result_summary.txt":
+                    with tar.extractfile(member) as src, open(summary_path, "wb") as dst:
+                        dst.write(src.read())
+                    return True
+    except Exception as e:
+        print(f"Error extracting result summary from {tarball}: {e}")
+    return False
+
+
+def build_phase_table(results_dir):
+    """
+    Walk <results_dir>/<host>/slot_<n>/instance_<m>_* and write a compact
+    per-phase table plus a per-phase summary into results_dir.
+    """
+    rows = []
+    for root, dirs, files in os.walk(results_dir):
+        dirs.sort()
+        for file in sorted(files):
+            if not file.endswith("_output.txt"):
+                continue
+            instance = file[:-len("_output.txt")]
+            slot_dir = root
+            host = os.path.basename(os.path.dirname(slot_dir))
+            slot = os.path.basename(slot_dir)
+            meta = {}
+            meta_path = os.path.join(slot_dir, f"{instance}_meta.json")
+            if os.path.exists(meta_path):
+                with open(meta_path, "r") as f:
+                    meta = json.load(f)
+            # Prefer the summary written by io500 itself; fall back to stdout,
+            # which also covers instances killed before they finished.
+            summary_path = os.path.join(slot_dir, f"{instance}_result_summary.txt")
+            phases = parse_io500_output(summary_path) if os.path.exists(summary_path) else []
+            if not phases:
+                phases = parse_io500_output(os.path.join(slot_dir, file))
+            for phase in phases:
+                row = {"host": host, "slot": slot, "instance": instance,
+                       "config": os.path.basename(meta.get("config_file", ""))}
+                row.update(phase)
+                rows.append(row)
+
+    with open(os.path.join(results_dir, PHASE_TABLE_FILE), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=PHASE_TABLE_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    summary = {}
+    for row in rows:
+        entry = summary.setdefault(row["phase"], {"instances": 0, "total_duration_s": 0.0,
+                                                  "mean_bandwidth_gib_s": None, "mean_kiops": None})
+        entry["instances"] += 1
+        entry["total_duration_s"] += row["duration_s"]
+    for phase, entry in summary.items():
+        for field, key in (("bandwidth_gib_s", "mean_bandwidth_gib_s"), ("kiops", "mean_kiops")):
+            values = [r[field] for r in rows if r["phase"] == phase and r[field] is not None]
+            if values:
+                entry[key] = sum(values) / len(values)
+    with open(os.path.join(results_dir, PHASE_SUMMARY_FILE), "w") as f:
+        json.dump(summary, f, indent=4)
+
+    print(f"Wrote {len(rows)} IO500 phase results to {os.path.join(results_dir, PHASE_TABLE_FILE)}")
+    return rows
@@ -1,5 +1,5 @@
 import paramiko
-import subprocess
+import asyncio
 import signal
 import sys
 import json
@@ -10,121 +10,285 @@ import argparse
 import shutil
 import time
 import re
+import struct
+import io500_results
+import stats_sampling
+import remote_sessions
 
-collect_stats_processes = []
-run_workloads_processes = []
+# Seconds to wait for a process tree after SIGTERM before escalating
+TEARDOWN_GRACE = 15
+# Seconds a remote command may go without producing output before it is
+# given up on, so that a hung host cannot block the campaign or its teardown
+REMOTE_COMMAND_TIMEOUT = 300
 
 CONFIG_FILE = {"standard": "cluster_config.json", "debug": "debug_cluster_config.json"}
 
+class CampaignState:
+    """
+    Everything started during a campaign that has to be torn down again.
+    Only touched from the event loop thread.
+    """
+
+    def __init__(self, username):
+        self.username = username
+        self.collect_stats_processes = []
+        self.run_workloads_processes = []
+        self.local_processes = []
+        self.stopping = False
+
+    def request_stop(self, sig, task):
+        if self.stopping:
+            # Teardown is stuck or too slow for the operator: leave now, but
+            # say what may still be running
+            print(f"Signal {sig.name} received again, exiting without waiting for teardown.")
+            for proc in self.run_workloads_processes + self.collect_stats_processes:
+                print(f"   session {proc['pid']} on {proc['host']} may still be running")
+            for process in self.local_processes:
+                print(f"   local process group {process.pid} may still be running")
+            sys.stdout.flush()
+            os._exit(1)
+        print(f"Signal {sig.name} received, cancelling the campaign and tearing down...")
+        self.stopping = True
+        task.cancel()
+
 def parse_config(config_type):
     with open(CONFIG_FILE[config_type], 'r') as f:
         config = json.load(f)
     os.environ["IOSENSE_CONFIG_FILE"] = CONFIG_FILE[config_type]
     return config
 
-def run_remote_command(host, username, command):
+def run_remote_command(host, username, command, timeout=REMOTE_COMMAND_TIMEOUT):
+    ssh = paramiko.SSHClient()
     try:
-        ssh = paramiko.SSHClient()
         ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         ssh.connect(hostname=host, username=username, timeout=10)
         # Prefix the command with sudo su - -c 'command'
-        stdin, stdout, stderr = ssh.exec_command(command)
+        stdin, stdout, stderr = ssh.exec_command(command, timeout=timeout)
         output = stdout.read().decode()
         error = stderr.read().decode()
-        ssh.close()
         return output.strip(), error.strip()
     except Exception as e:
         return '', f"SSH connection to {host} failed: {e}"
+    finally:
+        ssh.close()
+
+async def run_remote(host, username, command, timeout=REMOTE_COMMAND_TIMEOUT):
+    # paramiko is blocking, so every remote command gets a worker thread
+    return await asyncio.to_thread(run_remote_command, host, username, command, timeout)
 
+async def finish_then_cancel(coro):
+    """
+    Run coro to completion even if we are cancelled meanwhile, so that the
+    processes it starts are always recorded before teardown; then re-raise.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        await task
+        raise
+
+async def start_collect_stats(state, server_roles, server_config):
+    """
+    Start stats collection on every server. With server.stats_groups set, one
+    adaptive sampler per counter group matching the host's roles is started;
+    otherwise collect_stats.sh runs at server.stats_interval.
+    """
+    groups = stats_sampling.get_stats_groups(server_config) if 'stats_groups' in server_config else None
+    await asyncio.gather(*[start_host_collect_stats(state, host, roles, server_config, groups)
+                           for host, roles in server_roles.items()])
 
-def start_collect_stats(hosts, username, server_config):
-    global collect_stats_processes
-    for host in hosts:
-        stat_interval = 0.1
-        stats_logging_dir = server_config['stats_log_dir']
-        # Escape the $! so that it's evaluated on the remote host
-        command = f"nohup {server_config['install_dir']}/collect_stats.sh {stat_interval} {stats_logging_dir} > /dev/null 2>&1 & echo $!"
-        output, error = run_remote_command(host, username, command)
+async def start_host_collect_stats(state, host, roles, server_config, groups):
+    stats_logging_dir = server_config['stats_log_dir']
+    if groups is None:
+        stat_interval = server_config.get('stats_interval', 0.1)
+        # Escape the $! so that it's evaluated on the remote host.
+        # setsid makes the PID a session leader so the whole tree can be torn down.
+        commands = {'collect_stats': f"nohup setsid {server_config['install_dir']}/collect_stats.sh {stat_interval} {stats_logging_dir} > /dev/null 2>&1 & echo $!"}
+        manifest = {'collector': "collect_stats.sh", 'roles': sorted(roles), 'interval': stat_interval}
+    else:
+        host_groups = stats_sampling.groups_for_roles(groups, roles)
+        commands = {name: stats_sampling.sampler_command(name, group, stats_logging_dir) for name, group in host_groups.items()}
+        manifest = {'collector': "stats_groups", 'roles': sorted(roles), 'groups': host_groups}
+    manifest['start_time'] = time.time()
+    for name, command in commands.items():
+        output, error = await run_remote(host, state.username, command)
         if error:
-            print(f"Error starting collect_stats.sh on {host}: {error}")
+            print(f"Error starting {name} stats collection on {host}: {error}")
+            continue
+        pid = output.strip()
+        if pid.isdigit():
+            print(f"Started {name} stats collection on {host} with PID {pid}")
+            state.collect_stats_processes.append({'host': host, 'pid': pid, 'group': name})
         else:
-            pid = output.strip()
-            if pid.isdigit():
-                print(f"Started collect_stats.sh on {host} with PID {pid}")
-                collect_stats_processes.append({'host': host, 'pid': pid})
-            else:
-                print(f"Failed to get PID for collect_stats.sh on {host}: {output}")
+            print(f"Failed to get PID for {name} stats collection on {host}: {output}")
+    manifest_path = f"{stats_logging_dir}/{stats_sampling.MANIFEST_FILE}"
+    output, error = await run_remote(host, state.username, stats_sampling.write_remote_json_command(manifest_path, manifest))
+    if error:
+        print(f"Error writing sampling manifest on {host}: {error}")
+
+async def stop_collect_stats(state, server_config):
+    """
+    Record the CPU overhead of every stats collector in the host's stats
+    directory, then tear the collectors down.
+    """
+    stats_logging_dir = server_config['stats_log_dir']
+    processes = state.collect_stats_processes
+
+    async def measure(proc):
+        log_file = f"{stats_logging_dir}/{proc['group']}.log" if 'stats_groups' in server_config else "/dev/null"
+        output, error = await run_remote(proc['host'], state.username, stats_sampling.overhead_command(proc['pid'], log_file))
+        try:
+            return proc, json.loads(output)
+        except ValueError:
+            print(f"Error measuring {proc['group']} collector overhead on {proc['host']}: {error or output}")
+            return proc, None
+
+    overhead = {}
+    for proc, result in await asyncio.gather(*[measure(proc) for proc in processes]):
+        if result is not None:
+            overhead.setdefault(proc['host'], {})[proc['group']] = result
+
+    async def record(host, groups):
+        cpu_fraction = sum(group['cpu_fraction'] for group in groups.values())
+        print(f"Stats collection on {host} used {cpu_fraction * 100:.2f}% of a core")
+        overhead_path = f"{stats_logging_dir}/{stats_sampling.OVERHEAD_FILE}"
+        output, error = await run_remote(host, state.username, stats_sampling.write_remote_json_command(overhead_path, groups))
+        if error:
+            print(f"Error writing collector overhead on {host}: {error}")
 
-def gather_stats(hosts, username, workload, config):
-    server_config = config['server']
+    await asyncio.gather(*[record(host, groups) for host, groups in overhead.items()])
+    await stop_remote_processes(processes, state.username)
+
+async def gather_stats(hosts, username, workload, config):
     timestamp_dir = os.environ["IOSENSE_LOG_TIMESTAMP"]
     local_stats_dir = f"{config['data_dir']}/{workload}/stats/{timestamp_dir}"
     if not os.path.exists(local_stats_dir):
         os.makedirs(local_stats_dir)
-    for host in hosts:
-        zip_file_name = f"{host}_stats_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-        remote_stats_dir = f"{server_config['stats_log_dir']}"
-        remote_zip_file = f"{server_config['zip_logs_dir']}/{zip_file_name}"
-        local_zip_file = os.path.join(local_stats_dir, zip_file_name)
-        local_unzip_dir = os.path.join(local_stats_dir, f"{host}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}")
-        
-        # Command to zip the stats directory on the remote host
-        zip_command = f"cd {remote_stats_dir} && zip -r {remote_zip_file} ."
-        output, error = run_remote_command(host, username, zip_command)
+    await asyncio.gather(*[gather_host_stats(host, username, config['server'], local_stats_dir) for host in hosts])
+
+async def gather_host_stats(host, username, server_config, local_stats_dir):
+    zip_file_name = f"{host}_stats_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    remote_stats_dir = f"{server_config['stats_log_dir']}"
+    remote_zip_file = f"{server_config['zip_logs_dir']}/{zip_file_name}"
+    local_zip_file = os.path.join(local_stats_dir, zip_file_name)
+    local_unzip_dir = os.path.join(local_stats_dir, f"{host}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    
+    # Command to zip the stats directory on the remote host
+    zip_command = f"cd {remote_stats_dir} && zip -r {remote_zip_file} ."
+    output, error = await run_remote(host, username, zip_command)
+    if error:
+        print(f"Error zipping stats on {host}: {error}")
+        return
+    
+    # Download the zip file and unzip it locally
+    if await asyncio.to_thread(download_and_unzip, host, username, remote_zip_file, local_zip_file, local_unzip_dir):
+        # Clear the stats files on the remote host
+        clear_command = f"rm -rf {remote_stats_dir}/*"
+        output, error = await run_remote(host, username, clear_command)
         if error:
-            print(f"Error zipping stats on {host}: {error}")
-            continue
-        
-        # Create an SFTP client and download the zip file
-        try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(hostname=host, username=username, timeout=10)
-            sftp = ssh.open_sftp()
-            sftp.get(remote_zip_file, local_zip_file)
-            sftp.remove(remote_zip_file)  # Remove the zip file from the remote host
-            sftp.close()
-            
-            # Clear the stats files on the remote host
-            clear_command = f"rm -rf {remote_stats_dir}/*"
-            output, error = run_remote_command(host, username, clear_command)
+            print(f"Error clearing stats on {host}: {error}")
+        else:
+            print(f"Successfully cleared stats on {host}")
+
+def download_and_unzip(host, username, remote_zip_file, local_zip_file, local_unzip_dir):
+    # Create an SFTP client and download the zip file
+    try:
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(hostname=host, username=username, timeout=10)
+        sftp = ssh.open_sftp()
+        sftp.get_channel().settimeout(REMOTE_COMMAND_TIMEOUT)
+        sftp.get(remote_zip_file, local_zip_file)
+        sftp.remove(remote_zip_file)  # Remove the zip file from the remote host
+        sftp.close()
+        ssh.close()
+        print(f"Successfully downloaded {remote_zip_file} from {host} to {local_zip_file}")
+    except Exception as e:
+        print(f"Error transferring {remote_zip_file} from {host}: {e}")
+        return False
+
+    # Unzip the downloaded file
+    try:
+        os.makedirs(local_unzip_dir, exist_ok=True)
+        with zipfile.ZipFile(local_zip_file, 'r') as zip_ref:
+            zip_ref.extractall(local_unzip_dir)
+            # extractall stamps everything with the extraction time; keep the
+            # remote mtimes so archive time windows follow sampling time
+            for info in zip_ref.infolist():
+                mtime = zip_member_mtime(info)
+                os.utime(os.path.join(local_unzip_dir, info.filename), (mtime, mtime))
+        print(f"Successfully unzipped {local_zip_file} to {local_unzip_dir}")
+        # Optionally remove the zip file after unzipping
+        os.remove(local_zip_file)
+    except Exception as e:
+        print(f"Error unzipping {local_zip_file}: {e}")
+        return False
+    return True
+
+def zip_member_mtime(info):
+    """
+    Modification time of a zip member. Info-ZIP zip stores the exact UTC mtime
+    in the extended timestamp extra field (0x5455); fall back to date_time,
+    which is the remote host's local time at 2 second resolution.
+    """
+    extra = info.extra
+    while len(extra) >= 4:
+        header_id, size = struct.unpack("<HH", extra[:4])
+        data = extra[4:4 + size]
+        if header_id == 0x5455 and size >= 5 and data[0] & 1:
+            return struct.unpack("<i", data[1:5])[0]
+        extra = extra[4 + size:]
+    return time.mktime(info.date_time + (0, 0, -1))
+
+async def gather_interference_results(hosts, username, workload, config, interference_level, repetition_idx):
+    """
+    Fetch the per-slot IO500 outputs written by run_workloads.py on the
+    interference clients and index them into a per-phase table.
+    """
+    timestamp_dir = os.environ["IOSENSE_LOG_TIMESTAMP"]
+    remote_root = os.path.join(config['client']['install_dir'], "interference_results")
+    remote_results_dir = io500_results.interference_results_dir(remote_root, timestamp_dir, interference_level, repetition_idx)
+    local_results_dir = io500_results.interference_results_dir(f"{config['data_dir']}/{workload}/interference_results",
+                                                               timestamp_dir, interference_level, repetition_idx)
+    os.makedirs(local_results_dir, exist_ok=True)
+
+    async def gather_host(host):
+        zip_file_name = f"{host}_interference_{interference_level}_{repetition_idx}.zip"
+        remote_zip_file = f"/tmp/{zip_file_name}"
+        local_zip_file = os.path.join(local_results_dir, zip_file_name)
+        zip_command = f"cd {remote_results_dir} && zip -r {remote_zip_file} ."
+        output, error = await run_remote(host, username, zip_command)
+        if error:
+            print(f"Error zipping interference results on {host}: {error}")
+            return
+        if await asyncio.to_thread(download_and_unzip, host, username, remote_zip_file, local_zip_file, os.path.join(local_results_dir, host)):
+            output, error = await run_remote(host, username, f"rm -rf {remote_results_dir}")
             if error:
-                print(f"Error clearing stats on {host}: {error}")
-            else:
-                print(f"Successfully cleared stats on {host}")
-            
-            ssh.close()
-            print(f"Successfully gathered stats from {host} to {local_zip_file}")
-        except Exception as e:
-            print(f"Error transferring stats from {host}: {e}")
-
-        # Unzip the stats file
-        try:
-            os.makedirs(local_unzip_dir, exist_ok=True)
-            with zipfile.ZipFile(local_zip_file, 'r') as zip_ref:
-                zip_ref.extractall(local_unzip_dir)
-            print(f"Successfully unzipped stats for {host} to {local_unzip_dir}")
-            # Optionally remove the zip file after unzipping
-            os.remove(local_zip_file)
-        except Exception as e:
-            print(f"Error unzipping stats for {host}: {e}")
-
-def start_run_workloads(hosts, username, interference_level, client_config, config_path):
-    global run_workloads_processes
-    for host in hosts:
-        command = f"nohup python {client_config['install_dir']}/run_workloads.py --interference_level {interference_level} --config {config_path} > /dev/null 2>&1 & echo $!"
-        output, error = run_remote_command(host, username, command)
+                print(f"Error clearing interference results on {host}: {error}")
+
+    await asyncio.gather(*[gather_host(host) for host in hosts])
+    await asyncio.to_thread(io500_results.build_phase_table, local_results_dir)
+
+async def start_run_workloads(state, hosts, interference_level, repetition_idx, client_config, config_path):
+    timestamp_dir = os.environ["IOSENSE_LOG_TIMESTAMP"]
+
+    async def start_host(host):
+        command = f"IOSENSE_LOG_TIMESTAMP={timestamp_dir} nohup setsid python {client_config['install_dir']}/run_workloads.py --interference_level {interference_level} --repetition_idx {repetition_idx} --config {config_path} > /dev/null 2>&1 & echo $!"
+        output, error = await run_remote(host, state.username, command)
         if error:
             print(f"Error starting run_workloads.py on {host}: {error}")
         else:
             pid = output.strip()
             if pid.isdigit():
                 print(f"Started run_workloads.py on {host} with PID {pid}")
-                run_workloads_processes.append({'host': host, 'pid': pid})
+                state.run_workloads_processes.append({'host': host, 'pid': pid})
             else:
                 print(f"Failed to get PID for run_workloads.py on {host}: {output}")
 
-def remove_created_files(workload):
+    await asyncio.gather(*[start_host(host) for host in hosts])
+
+async def remove_created_files(workload):
     mnt_dir = "/mnt/hasanfs"
     workload_name = workload.lower()
     data_dir = f"{mnt_dir}/{workload_name}_data"
@@ -133,56 +297,156 @@ def remove_created_files(workload):
         command = f"rm -rf {data_dir}/*"
         print(f"Running command: {command}")
         # remove all files in the data_dir recursively
+        start_time = time.time()
+        process = await asyncio.create_subprocess_shell(command)
         try:
-            start_time = time.time()
-            subprocess.run(command, shell=True, check=True)
-            end_time = time.time()
-            print(f"Files removed successfully in {end_time - start_time} seconds.")
-            # sleep for 5 minutes to allow garbage collection
-            time.sleep(180)
-        except subprocess.CalledProcessError as e:
-            print(f"Error removing files in {data_dir}: {e}")
+            returncode = await process.wait()
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+        if returncode != 0:
+            print(f"Error removing files in {data_dir}: exit status {returncode}")
+            return
+        end_time = time.time()
+        print(f"Files removed successfully in {end_time - start_time} seconds.")
+        # sleep for 3 minutes to allow garbage collection
+        await asyncio.sleep(180)
 
 
 
-def stop_remote_processes(processes, username):
-    for proc in processes:
+async def stop_remote_processes(processes, username, grace=TEARDOWN_GRACE):
+    """
+    Tear down the sessions of all given remote processes concurrently,
+    forgetting each one once its teardown has finished.
+    """
+    async def stop(proc):
         host = proc['host']
         pid = proc['pid']
-        command = f"kill -9 {pid}"
-        output, error = run_remote_command(host, username, command)
-        if "node" in host:
-            backup_command1 = f"kill -9 $(pgrep run_workloads.py)"
-            output, error = run_remote_command(host, username, backup_command1)
-            backup_command2 = f"kill -9 $(pgrep io500)"
-            output, error = run_remote_command(host, username, backup_command2)
-            
-        if error:
-            print(f"Error stopping process {pid} on {host}: {error}")
-        else:
-            print(f"Stopped process {pid} on {host}")
+        try:
+            # pkill -s 0 would target the ssh session itself
+            if not pid.isdigit() or int(pid) <= 1:
+                print(f"Refusing to tear down invalid session {pid} on {host}")
+                return
+            # The teardown is silent until it has waited out both grace periods
+            output, error = await run_remote(host, username, remote_sessions.teardown_command(pid, grace), timeout=2 * grace + 30)
+            if error:
+                print(f"Error stopping process {pid} on {host}: {error}")
+            elif output.strip() != "0":
+                print(f"Warning: {output.strip()} processes of session {pid} still running on {host}")
+            else:
+                print(f"Stopped process {pid} and all its children on {host}")
+        finally:
+            processes.remove(proc)
 
-def start_local_run_workloads(workload, interference_level, repetition_idx):
-    process = subprocess.Popen(["python", "run_workloads.py", "--app", workload, "--interference_level", str(interference_level), "--target_host", "--repetition_idx", str(repetition_idx)], env=os.environ)
+    await asyncio.gather(*[stop(proc) for proc in list(processes)])
+
+async def start_local_run_workloads(state, workload, interference_level, repetition_idx):
+    # Own session so the whole local workload tree can be found and stopped by its sid
+    process = await asyncio.create_subprocess_exec("python", "run_workloads.py", "--app", workload, "--interference_level", str(interference_level), "--target_host", "--repetition_idx", str(repetition_idx), env=os.environ, start_new_session=True)
+    state.local_processes.append(process)
     return process
 
-def signal_handler(sig, frame):
-    print("Signal received, performing cleanup...")
-    cleanup()
-    sys.exit(0)
+def session_processes(sid):
+    """
+    Pids of the live (non-zombie) processes in local session sid, found via /proc.
+    """
+    pids = []
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat", "r") as f:
+                # Fields after the parenthesised command name: state ppid pgrp session ...
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if fields[0] != "Z" and int(fields[3]) == sid:
+            pids.append(int(pid))
+    return pids
+
+async def stop_local_process(process, grace=TEARDOWN_GRACE):
+    """
+    Stop a process started in its own session together with everything in that
+    session, whatever process group it moved to, the same way
+    remote_sessions.teardown_command does for remote sessions: SIGTERM to the
+    leader (so run_workloads.py can stop its own workloads), then SIGTERM to
+    the whole session, then SIGKILL.
+    """
+    sid = process.pid
+
+    async def wait_empty():
+        for _ in range(int(grace * 10)):
+            if not session_processes(sid):
+                return
+            await asyncio.sleep(0.1)
+
+    try:
+        process.send_signal(signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    await wait_empty()
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        pids = session_processes(sid)
+        if not pids:
+            break
+        print(f"{len(pids)} processes of local session {sid} still running, sending {sig.name}")
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+        await wait_empty()
+    # Reap the leader so it does not linger as a zombie
+    try:
+        await asyncio.wait_for(process.wait(), grace)
+    except asyncio.TimeoutError:
+        pass
+    left = session_processes(sid)
+    if left:
+        print(f"Warning: {len(left)} processes of local session {sid} still running: {left}")
+    else:
+        print(f"Stopped local session {sid}")
+
+async def stop_workloads(state):
+    """
+    Stop the local target workload and the remote interference workloads.
+    """
+    print("Stopping local and remote run_workloads.py processes...")
+    async def stop_local(process):
+        try:
+            await stop_local_process(process)
+        finally:
+            state.local_processes.remove(process)
+
+    await asyncio.gather(*[stop_local(process) for process in list(state.local_processes)],
+                         stop_remote_processes(state.run_workloads_processes, state.username))
+
+async def cleanup(state):
+    await stop_workloads(state)
+    print("Stopping stats collection on servers...")
+    await stop_remote_processes(state.collect_stats_processes, state.username)
+
 
-def cleanup():
-    print("Stopping any remaining remote run_workloads.py processes...")
-    if run_workloads_processes:
-        stop_remote_processes(run_workloads_processes, username)
-        run_workloads_processes.clear()
-    print("Stopping collect_stats.sh processes on servers...")
-    if collect_stats_processes:
-        stop_remote_processes(collect_stats_processes, username)
-        collect_stats_processes.clear()
+async def read_sync_changes(mds, sync_pattern):
+    # read sync_changes from one MDS
+    process = await asyncio.create_subprocess_exec("ssh", mds, "lctl", "get_param", "osc.*.sync_changes",
+                                                   stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(f"[{mds}] get_param sync_changes failed:\n{stderr.decode()}")
 
+    total_changes = 0
+    for line in stdout.decode().strip().splitlines():
+        m = sync_pattern.match(line.strip())
+        if m:
+            total_changes += int(m.group(1))
+    return total_changes
 
-def wait_for_sync_changes(mds_list, check_interval=2, verbose=True):
+async def wait_for_sync_changes(mds_list, check_interval=2, verbose=True):
     """
     Wait until all MDS nodes have osc.*.sync_changes == 0.
 
@@ -198,34 +462,76 @@ def wait_for_sync_changes(mds_list, check_interval=2, verbose=True):
         print("Waiting for osc.*.sync_changes to reach 0 on all MDS nodes...")
 
     while True:
-        all_done = True
-        for mds in mds_list:
-            # read sync_changes from each MDS
-            cmd = ["ssh", mds, "lctl", "get_param", "osc.*.sync_changes"]
-            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                    text=True, check=False)
-            if result.returncode != 0:
-                raise RuntimeError(f"[{mds}] get_param sync_changes failed:\n{result.stderr}")
-
-            lines = result.stdout.strip().splitlines()
-            total_changes = 0
-            for line in lines:
-                m = sync_pattern.match(line.strip())
-                if m:
-                    total_changes += int(m.group(1))
-
-            if verbose:
+        totals = await asyncio.gather(*[read_sync_changes(mds, sync_pattern) for mds in mds_list])
+        if verbose:
+            for mds, total_changes in zip(mds_list, totals):
                 print(f"   [{mds}] sync_changes total={total_changes}")
 
-            if total_changes > 0:
-                all_done = False
-
-        if all_done:
+        if not any(totals):
             if verbose:
                 print("All MDS nodes have zero sync_changes. Done.")
             break
 
-        time.sleep(check_interval)
+        await asyncio.sleep(check_interval)
+
+async def stop_repetition(state, config):
+    await stop_workloads(state)
+    await stop_collect_stats(state, config['server'])
+
+async def run_repetition(state, config, config_path, workload, server_hosts, server_roles, interference_level, repetition_idx):
+    """
+    One measurement window. Whatever happens, including cancellation, every
+    process started here is torn down before this returns or raises; the
+    results are only gathered when the repetition was not cancelled.
+    """
+    try:
+        print("Starting stats collection on servers...")
+        await finish_then_cancel(start_collect_stats(state, server_roles, config['server']))
+        print(f"\n=== Starting interference level {interference_level} ===")
+        if interference_level > 0:
+            print(f"Starting run_workloads.py on remote clients with interference level {interference_level}...")
+            await finish_then_cancel(start_run_workloads(state, config['interference_clients'], interference_level, repetition_idx, config['client'], config_path))
+        print(f"Starting run_workloads.py locally with workload {workload}...")
+        local_process = await finish_then_cancel(start_local_run_workloads(state, workload, interference_level, repetition_idx))
+        # Wait for local_process to complete
+        await local_process.wait()
+        print(f"Local run_workloads.py process completed for interference level {interference_level}.")
+    finally:
+        # Make sure nothing of this repetition outlives it, even if a signal
+        # arrives while we are already tearing down
+        print(f"Stopping workloads and stats collection for interference level {interference_level}...")
+        await finish_then_cancel(stop_repetition(state, config))
+
+    gathers = [gather_stats(server_hosts, state.username, workload, config), remove_created_files(workload)]
+    if interference_level > 0:
+        print(f"Gathering interference results for interference level {interference_level}...")
+        gathers.append(gather_interference_results(config['interference_clients'], state.username, workload, config, interference_level, repetition_idx))
+    await asyncio.gather(*gathers)
+    await wait_for_sync_changes(server_hosts)
+
+async def run_campaign(config, config_path, workload, username):
+    state = CampaignState(username)
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, state.request_stop, sig, task)
+
+    # Start collect_stats.sh on mdt and osts
+    server_hosts = config['mds'] + config['oss']
+    server_roles = stats_sampling.get_server_roles(config)
+    try:
+        # Interference levels from 1 to 5
+        interference_levels = [1, 2]
+        #assert 0 in interference_levels, "Interference level 0 is required"
+        for interference_level in interference_levels:
+            num_repetitions = 3
+            if interference_level == 0:
+                num_repetitions = 1
+            for repetition_idx in range(num_repetitions):
+                await run_repetition(state, config, config_path, workload, server_hosts, server_roles, interference_level, repetition_idx)
+        print("\nAll interference levels completed.")
+    finally:
+        await finish_then_cancel(cleanup(state))
 
 def main():
     global DEBUG
@@ -237,7 +543,6 @@ def main():
     else:
         DEBUG = False
 
-    global username
     workload = "IO500"
     username = "root"
     if DEBUG:
@@ -247,47 +552,19 @@ def main():
     else:
         config = parse_config("standard")
         config_path = os.path.join(config['client']['install_dir'], CONFIG_FILE["standard"])
+    if 'stats_groups' in config['server']:
+        # Fail before anything is started on the cluster
+        try:
+            stats_sampling.get_stats_groups(config['server'])
+        except ValueError as e:
+            print(f"Invalid server.stats_groups in config: {e}")
+            sys.exit(1)
     os.environ["IOSENSE_LOG_TIMESTAMP"] = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    # Start collect_stats.sh on mdt and osts
-    server_hosts = config['mds'] + config['oss']
-    # Register signal handler
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-
-    # Interference levels from 1 to 5
-    interference_levels = [1, 2]
-    #assert 0 in interference_levels, "Interference level 0 is required"
-    for interference_level in interference_levels:
-        num_repetitions = 3
-        if interference_level == 0:
-            num_repetitions = 1
-        for repetition_idx in range(num_repetitions):
-            print("Starting collect_stats.sh on servers...")
-            start_collect_stats(server_hosts, username, config['server'])
-            print(f"\n=== Starting interference level {interference_level} ===")
-            if interference_level > 0:
-                print(f"Starting run_workloads.py on remote clients with interference level {interference_level}...")
-                start_run_workloads(config['interference_clients'], username, interference_level, config['client'], config_path)
-            print(f"Starting run_workloads.py locally with workload {workload}...")
-            local_process = start_local_run_workloads(workload, interference_level, repetition_idx)
-            try:
-                # Wait for local_process to complete
-                local_process.wait()
-                print(f"Local run_workloads.py process completed for interference level {interference_level}.")
-            except Exception as e:
-                print(f"Exception: {e}")
-            finally:
-                print(f"Stopping remote run_workloads.py processes for interference level {interference_level}...")
-                stop_remote_processes(run_workloads_processes, username)
-                run_workloads_processes.clear()
-                print(f"Stopping collect_stats.sh on servers for interference level {interference_level}...")
-                stop_remote_processes(collect_stats_processes, username)
-                gather_stats(server_hosts, username, workload, config)
-                remove_created_files(workload)
-                collect_stats_processes.clear()
-                wait_for_sync_changes(server_hosts)
-    print("\nAll interference levels completed.")
-    cleanup()
+    try:
+        asyncio.run(run_campaign(config, config_path, workload, username))
+    except asyncio.CancelledError:
+        print("Campaign cancelled, all processes were torn down.")
+        sys.exit(0)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
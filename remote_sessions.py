@@ -0,0 +1,46 @@
+import shlex
+
+# Remote processes are started with "nohup setsid ... & echo $!" so that each
+# one leads its own session, independent of the ssh connection that started it,
+# and can be stopped as a whole by session id.
+
+
+def session_count_command(sid):
+    """
+    Shell snippet printing the number of non-zombie processes in session sid.
+    """
+    return f"ps -s {sid} -o stat= | grep -vc '^Z'"
+
+
+def start_session_command(command, log_file, status_file):
+    """
+    Remote command running command in its own session, with its output in
+    log_file and its exit status written to status_file. Prints the session id.
+    """
+    script = f"({command}); echo $? > {status_file}"
+    return f"rm -f {status_file}; nohup setsid bash -c {shlex.quote(script)} > {log_file} 2>&1 & echo $!"
+
+
+def session_status_command(sid, status_file):
+    """
+    Remote command printing "running" while session sid has live processes,
+    then the exit status from status_file, or "lost" if the session ended
+    without writing it (e.g. it was killed).
+    """
+    return (f"if [ $({session_count_command(sid)}) -gt 0 ]; then echo running; "
+            f"else cat {status_file} 2> /dev/null || echo lost; fi")
+
+
+def teardown_command(sid, grace):
+    """
+    Shell snippet that stops every process in session sid: SIGTERM to the leader
+    (so run_workloads.py can stop its own IO500 process groups), then SIGTERM to
+    the whole session, then SIGKILL, and finally prints how many non-zombie
+    processes are left.
+    """
+    polls = int(grace * 10)
+    count = session_count_command(sid)
+    wait_loop = f"for i in $(seq {polls}); do [ $({count}) -eq 0 ] && break; sleep 0.1; done"
+    return (f"kill -TERM {sid} 2> /dev/null; {wait_loop}; "
+            f"pkill -TERM -s {sid}; {wait_loop}; "
+            f"pkill -KILL -s {sid}; sleep 0.5; {count}")
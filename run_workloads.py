@@ -11,10 +11,15 @@ import json
 import shutil
 import datetime
 import paramiko
+import io500_results
+import config_variants
+import remote_sessions
 
 terminate_flag = False
 
 APPS = ["IO500", "amrex", "macsio", "e3sm", "openpmd"]
+# Seconds between status checks of a config variant running on another node
+VARIANT_POLL_INTERVAL = 10
 
 def load_config(config_path):
     global DEBUG
@@ -65,25 +70,15 @@ def run_remote_command(host, username, command):
     except Exception as e:
         return '', f"SSH connection to {host} failed: {e}"
     
-def kill_all_io500_processes(config, username):
-    print(f"Killing all IO500 processes on hosts: {config['interference_clients']}")
-    hosts = config['interference_clients']
-    print(f"Hosts: {hosts}")
-    for host in hosts:
-        command1 = f"kill -9 $(pidof -x run_workloads.py)"
-        output, error = run_remote_command(host, username, command1)
-        command2 = f"kill -9 $(pidof -x io500)"
-        output, error = run_remote_command(host, username, command2)
-
-    time.sleep(2)
-
-def run_interference_workload(config, interference_level):
+def run_interference_workload(config, interference_level, repetition_idx):
     """
     Run interference workload by maintaining interference_level number of IO500 processes.
     Each process runs with a random configuration from the interference_configs directory.
+    Every slot keeps the stdout and result summary of each instance it ran under
+    interference_results/<timestamp>/interference_level_<level>/<repetition>/slot_<n>.
     """
     global terminate_flag
-    processes = []
+    processes = {}
     print(f"Starting interference workload with interference level {interference_level}")
 
     # Paths to the run script and configuration directory
@@ -91,6 +86,15 @@ def run_interference_workload(config, interference_level):
     run_script = os.path.join(client_root, "workloads/IO500/run.sh")
     config_dir = os.path.join(client_root, "workloads/IO500/interference_configs")
 
+    if "IOSENSE_LOG_TIMESTAMP" in os.environ:
+        timestamp_dir = os.environ["IOSENSE_LOG_TIMESTAMP"]
+    else:
+        timestamp_dir = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        print(f"IOSENSE_LOG_TIMESTAMP is not set, using {timestamp_dir}")
+    results_dir = io500_results.interference_results_dir(os.path.join(client_root, "interference_results"),
+                                                         timestamp_dir, interference_level, repetition_idx)
+    print(f"Saving interference results to {results_dir}")
+
     # Get list of configuration files
     sample_dict = create_sample_dict(config_dir)
     if not sample_dict:
@@ -99,26 +103,28 @@ def run_interference_workload(config, interference_level):
 
     try:
         # Start initial IO500 processes
-        for _ in range(interference_level):
-            print(f"Starting IO500 process {_}")
-            p = start_io500_process(run_script, sample_dict)
-            if p:
-                processes.append(p)
+        for slot in range(interference_level):
+            print(f"Starting IO500 process {slot}")
+            instance = start_io500_process(run_script, sample_dict, os.path.join(results_dir, f"slot_{slot}"), 0)
+            if instance:
+                processes[slot] = instance
 
         # Main loop to monitor processes
         while not terminate_flag:
             # Check for completed processes
-            for p in processes[:]:  # Iterate over a copy of the list
+            for slot, instance in list(processes.items()):
+                p = instance['process']
                 retcode = p.poll()
                 if retcode is not None:
                     # Process has finished
                     print(f"IO500 process with PID {p.pid} exited with return code {retcode}")
-                    processes.remove(p)
+                    finish_io500_instance(instance, retcode)
+                    del processes[slot]
                     if not terminate_flag:
-                        # Start a new process to maintain the interference level
-                        new_p = start_io500_process(run_script, sample_dict)
-                        if new_p:
-                            processes.append(new_p)
+                        # Start a new process in the same slot to maintain the interference level
+                        new_instance = start_io500_process(run_script, sample_dict, instance['slot_dir'], instance['index'] + 1)
+                        if new_instance:
+                            processes[slot] = new_instance
             time.sleep(1)  # Sleep to prevent busy waiting
 
     except Exception as e:
@@ -126,8 +132,9 @@ def run_interference_workload(config, interference_level):
     finally:
         # Terminate all running IO500 processes
         print("Terminating all IO500 interference processes.")
-        for p in processes:
-            terminate_process(p)
+        terminate_processes([instance['process'] for instance in processes.values()])
+        for instance in processes.values():
+            finish_io500_instance(instance, instance['process'].returncode)
         print("Interference workload terminated.")
 
 def create_sample_dict(config_dir):
@@ -150,35 +157,94 @@ def sample_config_file(sample_dict):
     config_files = sample_dict[config_dir]
     return random.choice(config_files)
 
-def start_io500_process(run_script, sample_dict):
+def start_io500_process(run_script, sample_dict, slot_dir, index):
     """
-    Start an IO500 process with a random configuration file.
+    Start an IO500 process with a random configuration file, capturing its
+    stdout under slot_dir as instance_<index>_output.txt.
     """
     try:
         sampled_config_file = sample_config_file(sample_dict)
         print(f"Starting IO500 with configuration: {sampled_config_file}")
-        command = f"{run_script} {sampled_config_file} > output.txt"
+        os.makedirs(slot_dir, exist_ok=True)
+        name = f"instance_{index}"
+        output_path = os.path.join(slot_dir, f"{name}_output.txt")
+        command = f"{run_script} {sampled_config_file} > {output_path} 2>&1"
         print(f"Running command: {command}")
-        p = subprocess.Popen(command, shell=True, env=os.environ)
+        # Each instance gets its own process group (in our session) so it can be
+        # stopped together with its mpiexec children and MPI ranks.
+        p = subprocess.Popen(command, shell=True, env=os.environ, preexec_fn=os.setpgrp)
         print(f"Started IO500 process with PID {p.pid}")
-        return p
+        instance = {'process': p, 'slot_dir': slot_dir, 'index': index, 'name': name,
+                    'output_path': output_path,
+                    'meta': {'config_file': sampled_config_file, 'start_time': time.time()}}
+        write_instance_meta(instance)
+        return instance
     except Exception as e:
         print(f"Failed to start IO500 process: {e}")
         return None
 
-def terminate_process(p):
+def finish_io500_instance(instance, retcode):
     """
-    Terminate the given subprocess.Popen object.
+    Record the end of an IO500 instance and keep its result summary.
     """
+    instance['meta']['end_time'] = time.time()
+    instance['meta']['returncode'] = retcode
+    summary_path = os.path.join(instance['slot_dir'], f"{instance['name']}_result_summary.txt")
+    instance['meta']['result_summary'] = io500_results.save_result_summary(instance['output_path'], summary_path)
+    write_instance_meta(instance)
+
+def write_instance_meta(instance):
+    meta_path = os.path.join(instance['slot_dir'], f"{instance['name']}_meta.json")
     try:
-        p.terminate()
-        p.wait(timeout=5)
-        print(f"Terminated IO500 process with PID {p.pid}")
-    except subprocess.TimeoutExpired:
-        p.kill()
-        print(f"Killed IO500 process with PID {p.pid} after timeout")
+        with open(meta_path, "w") as f:
+            json.dump(instance['meta'], f, indent=4)
     except Exception as e:
-        print(f"Error terminating process {p.pid}: {e}")
+        print(f"Error writing {meta_path}: {e}")
+
+def terminate_processes(processes, timeout=5):
+    """
+    Terminate the process groups of the given subprocess.Popen objects,
+    escalating to SIGKILL for any group still alive after timeout.
+    """
+    pgids = [p.pid for p in processes]
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        for p in processes:
+            try:
+                os.killpg(p.pid, sig)
+            except ProcessLookupError:
+                pass
+            except Exception as e:
+                print(f"Error sending {sig.name} to process group {p.pid}: {e}")
+        deadline = time.time() + timeout
+        for p in processes:
+            try:
+                p.wait(timeout=max(deadline - time.time(), 0))
+            except subprocess.TimeoutExpired:
+                pass
+        alive = [p for p in processes if process_group_alive(p.pid)]
+        if not alive:
+            break
+        print(f"Process groups still running after {sig.name}: {[p.pid for p in alive]}")
+        processes = alive
+    for pgid in pgids:
+        print(f"Terminated IO500 process group {pgid}")
+
+def process_group_alive(pgid):
+    """
+    Check /proc for a live (non-zombie) member of process group pgid.
+    """
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat", "r") as f:
+                # Fields after the parenthesised command name: state ppid pgrp ...
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if fields[0] != "Z" and int(fields[2]) == pgid:
+            return True
+    return False
 
 def get_config_dirs(config_dir):
     """
@@ -205,12 +271,14 @@ def get_config_files(dir_path):
         return []
 
 
-def gather_darshan_logs(darshan_log_dir, workload, config, config_ini, interference_level, repetition_idx):
+def gather_darshan_logs(darshan_log_dir, workload, config, config_ini, interference_level, repetition_idx, dated_subdirs=True):
     config_ini = os.path.basename(config_ini).split(".")[0]
     print(f"Starting to gather Darshan logs for workload: {workload}, config: {config_ini}, interference level: {interference_level}")
     
-    day, month, year = datetime.datetime.now().day, datetime.datetime.now().month, datetime.datetime.now().year
-    darshan_log_dir = f"{darshan_log_dir}/{year}/{month}/{day}"
+    # Variants log to their own DARSHAN_LOG_DIR_PATH, which has no date subdirectories
+    if dated_subdirs:
+        day, month, year = datetime.datetime.now().day, datetime.datetime.now().month, datetime.datetime.now().year
+        darshan_log_dir = f"{darshan_log_dir}/{year}/{month}/{day}"
     print(f"Darshan log directory: {darshan_log_dir}")
 
     if "IOSENSE_LOG_TIMESTAMP" in os.environ:
@@ -250,6 +318,200 @@ def gather_darshan_logs(darshan_log_dir, workload, config, config_ini, interfere
     print(f"Finished gathering Darshan logs. Moved {idx} files.")
 
 
+def cleanup_data_dir(data_dir):
+    """
+    Aggressively remove a workload data directory, retrying until it is gone.
+    """
+    max_retries = 3
+    retry_delay = 5  # seconds
+    for attempt in range(max_retries):
+        # First try to remove contents recursively using find
+        find_command = f"find {data_dir} -delete"
+        print(f"Running find cleanup command (attempt {attempt + 1}/{max_retries}): {find_command}")
+        p = subprocess.Popen(find_command, shell=True, env=os.environ)
+        p.wait()
+
+        # Then try regular rm -rf as backup
+        command = f"rm -rf {data_dir}"
+        print(f"Running rm cleanup command (attempt {attempt + 1}/{max_retries}): {command}")
+        p = subprocess.Popen(command, shell=True, env=os.environ)
+        retcode = p.wait()
+        
+        # Verify if directory is actually gone
+        if not os.path.exists(data_dir):
+            print("Cleanup completed successfully")
+            break
+        else:
+            print(f"Cleanup attempt {attempt + 1} failed - directory still exists")
+            if attempt < max_retries - 1:
+                print(f"Waiting {retry_delay} seconds before retrying...")
+                time.sleep(retry_delay)
+            else:
+                print(f"Warning: Failed to clean up data directory {data_dir} after all retries")
+
+def get_variant_slots(config):
+    """
+    Build the list of (host, cores) execution slots for config variants.
+    cores is a taskset cpu list, or None when no pinning is configured.
+    """
+    variant_config = config.get('target_variants', {})
+    parallelism = variant_config.get('parallelism', 1)
+    nodes = variant_config.get('target_nodes', [config['target_client']])
+    cores_per_slot = variant_config.get('cores_per_slot')
+    slots = []
+    for host in nodes:
+        for idx in range(parallelism):
+            cores = None
+            if cores_per_slot:
+                cores = f"{idx * cores_per_slot}-{(idx + 1) * cores_per_slot - 1}"
+            slots.append((host, cores))
+    return slots
+
+def start_variant_process(config, app_name, run_script, variant, host, cores):
+    """
+    Start one config variant on host, with its own data and Darshan log directories.
+    """
+    os.makedirs(variant['darshan_dir'], exist_ok=True)
+    command = f"mkdir -p {variant['data_dir']} && "
+    command += f"export DARSHAN_LOG_DIR_PATH={variant['darshan_dir']} && "
+    if app_name == "IO500":
+        if variant['ranks'] is not None:
+            command += f"export IO500_NP={variant['ranks']} && "
+        run_command = f"{run_script} {variant['config_file']} true"
+    else:
+        run_command = f"{run_script} {variant['config_file']} {variant['data_dir']}"
+    if cores:
+        run_command = f"taskset -c {cores} {run_command}"
+    command += run_command
+    print(f"Running variant {variant['name']} on {host} (cores: {cores}): {command}")
+    if host == config['target_client']:
+        p = subprocess.Popen(command, shell=True, env=os.environ, stdin=subprocess.DEVNULL, preexec_fn=os.setpgrp)
+        return {'host': host, 'process': p}
+    # The data dir is on Lustre, but the variant config and Darshan log dir are node-local
+    config_dir = os.path.dirname(variant['config_file'])
+    subprocess.run(["ssh", host, f"mkdir -p {config_dir} {variant['darshan_dir']}"], stdin=subprocess.DEVNULL, check=False)
+    subprocess.run(["scp", variant['config_file'], f"{host}:{variant['config_file']}"], stdin=subprocess.DEVNULL, check=False)
+    # Own session on the remote node, like the stats collectors and interference
+    # workloads, so it can be polled and torn down by session id
+    log_file = f"{variant['darshan_dir']}.out"
+    status_file = f"{variant['darshan_dir']}.status"
+    start_command = remote_sessions.start_session_command(command, log_file, status_file)
+    result = subprocess.run(["ssh", host, start_command], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, text=True, check=False)
+    sid = result.stdout.strip()
+    if result.returncode != 0 or not sid.isdigit() or int(sid) <= 1:
+        print(f"Error starting variant {variant['name']} on {host}: {result.stderr.strip()}")
+        return None
+    print(f"Started variant {variant['name']} on {host} in session {sid} (output: {host}:{log_file})")
+    return {'host': host, 'sid': sid, 'status_file': status_file, 'log_file': log_file, 'next_poll': 0}
+
+def poll_variant(handle):
+    """
+    Return the exit status of a started variant, or None while it is running.
+    Remote variants are polled at most every VARIANT_POLL_INTERVAL seconds.
+    """
+    if 'process' in handle:
+        return handle['process'].poll()
+    if time.time() < handle['next_poll']:
+        return None
+    handle['next_poll'] = time.time() + VARIANT_POLL_INTERVAL
+    command = remote_sessions.session_status_command(handle['sid'], handle['status_file'])
+    result = subprocess.run(["ssh", handle['host'], command], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, text=True, check=False)
+    status = result.stdout.strip()
+    if result.returncode != 0 or status == "running":
+        # An unreachable host is retried on the next poll
+        return None
+    if not status.lstrip("-").isdigit():
+        print(f"Session {handle['sid']} on {handle['host']} ended without an exit status")
+        return -1
+    return int(status)
+
+def stop_variants(handles, grace=5):
+    """
+    Tear down running variants: local ones by process group, remote ones by
+    session, with all remote teardowns running alongside the local one.
+    """
+    teardowns = []
+    for handle in handles:
+        if 'sid' not in handle:
+            continue
+        command = remote_sessions.teardown_command(handle['sid'], grace)
+        p = subprocess.Popen(["ssh", handle['host'], command], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, text=True)
+        teardowns.append((handle, p))
+    terminate_processes([handle['process'] for handle in handles if 'process' in handle], timeout=grace)
+    for handle, p in teardowns:
+        output, error = p.communicate()
+        if p.returncode != 0:
+            print(f"Error stopping session {handle['sid']} on {handle['host']}: {error.strip()}")
+        elif output.strip() != "0":
+            print(f"Warning: {output.strip()} processes of session {handle['sid']} still running on {handle['host']}")
+        else:
+            print(f"Stopped session {handle['sid']} on {handle['host']}")
+
+def collect_variant_darshan_logs(config, host, variant):
+    if host == config['target_client']:
+        return
+    command = ["scp", "-r", f"{host}:{variant['darshan_dir']}/.", variant['darshan_dir']]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=False)
+    if result.returncode != 0:
+        print(f"Error copying Darshan logs of {variant['name']} from {host}: {result.stderr}")
+
+def run_config_variants(config, app_name, run_script, config_file, spec, interference_level, repetition_idx):
+    """
+    Expand config_file into its rank-count/size variants and run them across
+    the configured execution slots, cleaning up each variant's data dir and
+    gathering its Darshan logs as soon as it finishes.
+    """
+    timestamp_dir = os.environ.get("IOSENSE_LOG_TIMESTAMP", datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+    client_root = config['client']['install_dir']
+    variants_dir = os.path.join(client_root, "variant_configs", timestamp_dir, f"interference_level_{interference_level}", str(repetition_idx))
+    data_root = os.path.join(config.get('lfs_mount_dir', "/mnt/hasanfs"), f"{app_name.lower()}_data", "variants")
+    darshan_root = os.path.join(config['darshan_log_dir'], "variants", timestamp_dir)
+    pending = config_variants.expand_config_variants(config_file, spec, variants_dir, data_root, darshan_root)
+    free_slots = get_variant_slots(config)
+    running = []
+    failed = []
+    try:
+        while (pending or running) and not terminate_flag:
+            while pending and free_slots:
+                variant = pending.pop(0)
+                host, cores = free_slots.pop(0)
+                handle = start_variant_process(config, app_name, run_script, variant, host, cores)
+                if handle is None:
+                    failed.append(variant['name'])
+                    free_slots.append((host, cores))
+                    cleanup_data_dir(variant['data_dir'])
+                    continue
+                running.append((handle, variant, host, cores))
+            for entry in running[:]:
+                handle, variant, host, cores = entry
+                retcode = poll_variant(handle)
+                if retcode is None:
+                    continue
+                running.remove(entry)
+                free_slots.append((host, cores))
+                if retcode != 0:
+                    print(f"Variant {variant['name']} exited with return code {retcode}")
+                    failed.append(variant['name'])
+                else:
+                    print(f"Completed variant {variant['name']} on {host}")
+                    collect_variant_darshan_logs(config, host, variant)
+                    gather_darshan_logs(variant['darshan_dir'], app_name, config, variant['config_file'], interference_level, repetition_idx, dated_subdirs=False)
+                cleanup_data_dir(variant['data_dir'])
+            time.sleep(1)
+    finally:
+        if running:
+            print(f"Stopping {len(running)} running {app_name} variants")
+            stop_variants([entry[0] for entry in running])
+    if terminate_flag:
+        print(f"{app_name} variants interrupted, {len(pending)} not started")
+        sys.exit(1)
+    if failed:
+        print(f"{len(failed)} {app_name} variants failed: {failed}")
+        sys.exit(1)
+
 def run_application_workload(config, app_name, interference_level, repetition_idx):
     """
     Run the specified application workload.
@@ -283,6 +545,11 @@ def run_application_workload(config, app_name, interference_level, repetition_id
                     if "debug" in config_file:
                         print(f"Skipping {config_file} because it is a debug config")
                         continue
+                variant_spec = config_variants.get_variant_spec(config, app_name)
+                if variant_spec:
+                    run_config_variants(config, app_name, run_script, config_file, variant_spec, interference_level, repetition_idx)
+                    time.sleep(6*60)
+                    continue
                 print(f"Running {app_name} with configuration: {config_file}")
                 if app_name == "IO500":
                     command = f"{run_script} {config_file} true"
@@ -298,33 +565,7 @@ def run_application_workload(config, app_name, interference_level, repetition_id
                     print(f"Completed {app_name} with configuration: {config_file}")
                     gather_darshan_logs(config['darshan_log_dir'], app_name, config, config_file, interference_level, repetition_idx)
                 
-                # Add more aggressive cleanup logic
-                max_retries = 3
-                retry_delay = 5  # seconds
-                for attempt in range(max_retries):
-                    # First try to remove contents recursively using find
-                    find_command = "find /mnt/hasanfs/io500_data -delete"
-                    print(f"Running find cleanup command (attempt {attempt + 1}/{max_retries}): {find_command}")
-                    p = subprocess.Popen(find_command, shell=True, env=os.environ)
-                    p.wait()
-
-                    # Then try regular rm -rf as backup
-                    command = "rm -rf /mnt/hasanfs/io500_data"
-                    print(f"Running rm cleanup command (attempt {attempt + 1}/{max_retries}): {command}")
-                    p = subprocess.Popen(command, shell=True, env=os.environ)
-                    retcode = p.wait()
-                    
-                    # Verify if directory is actually gone
-                    if not os.path.exists("/mnt/hasanfs/io500_data"):
-                        print("Cleanup completed successfully")
-                        break
-                    else:
-                        print(f"Cleanup attempt {attempt + 1} failed - directory still exists")
-                        if attempt < max_retries - 1:
-                            print(f"Waiting {retry_delay} seconds before retrying...")
-                            time.sleep(retry_delay)
-                        else:
-                            print("Warning: Failed to clean up IO500 data directory after all retries")
+                cleanup_data_dir("/mnt/hasanfs/io500_data")
                 time.sleep(6*60)
             print("Application workload completed.")
         except Exception as e:
@@ -339,7 +580,7 @@ def main(args):
     if not args.target_host:
         if args.interference_level > 0:
             random.seed(args.interference_level+10)
-            run_interference_workload(config, args.interference_level)
+            run_interference_workload(config, args.interference_level, args.repetition_idx or 0)
     else:
         run_application_workload(config, args.app, args.interference_level, args.repetition_idx)
 
@@ -0,0 +1,115 @@
+import json
+import shlex
+
+# Counter groups sampled on the servers when server.stats_groups is set in the
+# cluster config. Each group runs its own sampler loop on every host with one
+# of its roles, polling "command" every active_interval seconds while the
+# counters change and backing off exponentially up to idle_interval while they
+# do not. A group may leave out any field to inherit it from these defaults;
+# active_interval falls back to server.stats_interval.
+DEFAULT_STATS_GROUPS = {
+    "mdt": {"roles": ["mds"], "command": "lctl get_param mdt.*.md_stats", "idle_interval": 5.0},
+    "osc": {"roles": ["mds"], "command": "lctl get_param osc.*.stats osc.*.sync_changes", "idle_interval": 10.0},
+    "ost": {"roles": ["oss"], "command": "lctl get_param obdfilter.*.stats ost.OSS.*.stats", "idle_interval": 5.0},
+    "lnet": {"roles": ["mds", "oss"], "command": "lnetctl stats show", "active_interval": 1.0, "idle_interval": 10.0},
+}
+
+# Every sample starts with this marker followed by the epoch time and the
+# interval the sampler is running at; unchanged samples are not written.
+SAMPLE_MARKER = "###"
+# lctl stats lines that change on every read and must not count as activity
+VOLATILE_FIELDS = ["snapshot_time", "start_time", "elapsed_time"]
+MANIFEST_FILE = "sampling_manifest.json"
+SERVER_ROLES = ["mds", "oss"]
+REQUIRED_GROUP_FIELDS = ["roles", "command"]
+OVERHEAD_FILE = "collector_overhead.json"
+
+
+def get_server_roles(config):
+    """
+    Map each server host to its set of roles ("mds", "oss").
+    """
+    roles = {}
+    for role in SERVER_ROLES:
+        for host in config[role]:
+            roles.setdefault(host, set()).add(role)
+    return roles
+
+
+def get_stats_groups(server_config):
+    """
+    Resolve the configured counter groups against DEFAULT_STATS_GROUPS.
+    Raises ValueError for a group that is missing a field or has an invalid one.
+    """
+    if not isinstance(server_config['stats_groups'], dict):
+        raise ValueError(f"server.stats_groups must map group names to overrides, got {server_config['stats_groups']}")
+    groups = {}
+    for name, overrides in server_config['stats_groups'].items():
+        if overrides is not None and not isinstance(overrides, dict):
+            raise ValueError(f"Stats group '{name}' must be an object of overrides, got {overrides}")
+        group = dict(DEFAULT_STATS_GROUPS.get(name, {}))
+        group.update(overrides or {})
+        group.setdefault('active_interval', server_config.get('stats_interval', 0.1))
+        group.setdefault('idle_interval', group['active_interval'])
+        missing = [field for field in REQUIRED_GROUP_FIELDS if not group.get(field)]
+        if missing:
+            raise ValueError(f"Stats group '{name}' has no {missing}; groups other than "
+                             f"{list(DEFAULT_STATS_GROUPS)} must set them in server.stats_groups")
+        if not isinstance(group['roles'], list) or any(role not in SERVER_ROLES for role in group['roles']):
+            raise ValueError(f"Stats group '{name}' roles must be a list of {SERVER_ROLES}, got {group['roles']}")
+        intervals = [group['active_interval'], group['idle_interval']]
+        if any(isinstance(interval, bool) or not isinstance(interval, (int, float)) for interval in intervals):
+            raise ValueError(f"Stats group '{name}' intervals must be numbers of seconds, got {intervals}")
+        if not 0 < group['active_interval'] <= group['idle_interval']:
+            raise ValueError(f"Stats group '{name}' needs 0 < active_interval <= idle_interval, "
+                             f"got {group['active_interval']} and {group['idle_interval']}")
+        groups[name] = group
+    return groups
+
+
+def groups_for_roles(groups, roles):
+    return {name: group for name, group in groups.items() if roles & set(group['roles'])}
+
+
+def sampler_command(name, group, stats_log_dir):
+    """
+    Remote command starting the sampler loop of one group in its own session.
+    Prints the session id.
+    """
+    volatile = " ".join(f"-e {field}" for field in VOLATILE_FIELDS)
+    active = group['active_interval']
+    idle = group['idle_interval']
+    script = (
+        f"prev=''; interval={active}; "
+        f"while true; do "
+        f"out=$({group['command']} 2>&1); now=$(date +%s.%N); "
+        f"sum=$(printf '%s' \"$out\" | grep -v {volatile} | cksum); "
+        f"if [ \"$sum\" != \"$prev\" ]; then "
+        f"interval={active}; printf '{SAMPLE_MARKER} %s %s\\n%s\\n' \"$now\" \"$interval\" \"$out\"; "
+        f"else interval=$(awk -v i=$interval -v m={idle} 'BEGIN {{ i *= 2; print (i > m ? m : i) }}'); fi; "
+        f"prev=$sum; sleep $interval; "
+        f"done >> {stats_log_dir}/{name}.log"
+    )
+    return f"nohup setsid bash -c {shlex.quote(script)} > /dev/null 2>&1 & echo $!"
+
+
+def write_remote_json_command(path, data):
+    return f"echo {shlex.quote(json.dumps(data, indent=4))} > {path}"
+
+
+def overhead_command(sid, log_file):
+    """
+    Remote command printing the CPU time used by a sampler session as JSON.
+    utime/stime of the leader plus cutime/cstime of the commands it waited for,
+    against the wall time since the leader started.
+    """
+    return (
+        f"ticks=$(getconf CLK_TCK); uptime=$(cut -d' ' -f1 /proc/uptime); "
+        f"samples=$(grep -c '^{SAMPLE_MARKER} ' {log_file} 2> /dev/null); "
+        f"bytes=$(stat -c %s {log_file} 2> /dev/null); "
+        f"rest=$(sed 's/.*) //' /proc/{sid}/stat) && "
+        f"echo $rest | awk -v t=$ticks -v u=$uptime -v n=${{samples:-0}} -v b=${{bytes:-0}} "
+        f"'{{ cpu = ($12 + $13 + $14 + $15) / t; wall = u - $20 / t; "
+        f"printf \"{{\\\"cpu_seconds\\\": %.2f, \\\"wall_seconds\\\": %.2f, \\\"cpu_fraction\\\": %.5f, \\\"samples\\\": %d, \\\"log_bytes\\\": %d}}\", "
+        f"cpu, wall, (wall > 0 ? cpu / wall : 0), n, b }}'"
+    )
@@ -15,13 +15,13 @@ config_file="$1"
 if [ $# -eq 2 ]; then
     # Check if Darshan tracing is enabled (second argument is a boolean)
     if [ "$2" = "true" ]; then
-        mpi_args="-np 4 -env DXT_ENABLE_IO_TRACE 1 -env LD_PRELOAD /custom-install/hpc-tools/pnetcdf-1.13.0/install/lib/libpnetcdf.so:/custom-install/hpc-tools/hdf5-1.14.4-3/install/lib/libhdf5.so:/custom-install/io-profilers/darshan-3.4.5/darshan-runtime/install/lib/libdarshan.so"
+        mpi_args="-np ${IO500_NP:-4} -env DXT_ENABLE_IO_TRACE 1 -env LD_PRELOAD /custom-install/hpc-tools/pnetcdf-1.13.0/install/lib/libpnetcdf.so:/custom-install/hpc-tools/hdf5-1.14.4-3/install/lib/libhdf5.so:/custom-install/io-profilers/darshan-3.4.5/darshan-runtime/install/lib/libdarshan.so"
     else
-        mpi_args="-np 4"
+        mpi_args="-np ${IO500_NP:-4}"
     fi
 else
     # Default to no Darshan tracing if only one argument is provided
-    mpi_args="-np 4"
+    mpi_args="-np ${IO500_NP:-4}"
 fi
 
 # Export the MPI arguments so they can be used in the IO500 script
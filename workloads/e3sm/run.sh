@@ -1,6 +1,8 @@
 #!/bin/bash
 config_file="$1"
 
-h5bench_dir="/mnt/hasanfs/e3sm_data"
+# Optional second argument overrides the data directory (used by config variants)
+h5bench_dir="${2:-/mnt/hasanfs/e3sm_data}"
+mkdir -p $h5bench_dir
 cd $h5bench_dir
 h5bench --debug $config_file
\ No newline at end of file
@@ -3,6 +3,8 @@
 # Async vol support needed in bashrc and h5bench config
 config_file="$1"
 
-h5bench_dir="/mnt/hasanfs/openpmd_data"
+# Optional second argument overrides the data directory (used by config variants)
+h5bench_dir="${2:-/mnt/hasanfs/openpmd_data}"
+mkdir -p $h5bench_dir
 cd $h5bench_dir
 h5bench --debug $config_file
\ No newline at end of file